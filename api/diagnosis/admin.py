@@ -1,14 +1,17 @@
 from django.contrib import admin
+from django.http import HttpResponseRedirect
+from django.urls import reverse
 
-from .models import TestingRecording, Scenario, ScenariosSet
+from . import jobs
+from .models import TestingRecording, Scenario, ScenariosSet, Job, CommitInfo
 
 
 @admin.action(description='Recalculate statistics from file')
 def recalculate_statistics(modeladmin, request, queryset):
-    for o in queryset:
-        if o.file.storage.exists(o.file.name):
-            o.processed=False
-            o.save()
+    batch, n = jobs.reprocess(queryset)
+    modeladmin.message_user(request, f'{n} recordings queued for processing')
+    if n:
+        return HttpResponseRedirect(reverse('batch_progress', kwargs={'batch': batch}))
 
 
 class TestingRecordingAdmin(admin.ModelAdmin):
@@ -29,6 +32,20 @@ class CompareAdmin(admin.ModelAdmin):
     list_display = ('obj1', 'obj2', 'n_targets')
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'recording', 'scenarios_set', 'status', 'attempts', 'created', 'duration')
+    list_filter = ('status', 'kind')
+    search_fields = ('=batch',)
+    readonly_fields = ('error',)
+
+
+class CommitInfoAdmin(admin.ModelAdmin):
+    list_display = ('sha1', 'message', 'date', 'fetched')
+    search_fields = ('sha1',)
+
+
 admin.site.register(TestingRecording, TestingRecordingAdmin)
 admin.site.register(Scenario, ScenarioAdmin)
 admin.site.register(ScenariosSet, ScenariosSetAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(CommitInfo, CommitInfoAdmin)
@@ -0,0 +1,292 @@
+"""
+Cross-recording analytics served from database aggregates
+"""
+from collections import OrderedDict
+
+import numpy as np
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.functions import Coalesce
+
+from .models import RecordingStats, Scenario, ScenarioResult, STATUS
+
+# Codes counted as solved scenarios, same as plot_minister_mode
+SUCCESS_CODES = (0, 1, 5)
+
+
+def trend(n_targets=None, last=None):
+    """
+    Code shares of processed recordings over time, grouped by number of targets and ordered by
+    commit date (upload date for recordings without commit), then build number.
+    Served from RecordingStats with one query
+    @param n_targets: only recordings with this number of targets
+    @param last: only the last recordings of every group
+    @return: list of groups {'n_targets': ..., 'recordings': [...]}
+    """
+    stats = RecordingStats.objects.filter(recording__processed=True)
+    if n_targets:
+        stats = stats.filter(recording__n_targets=n_targets)
+    rows = (stats
+            .annotate(when=Coalesce('recording__commit_date', 'recording__date'))
+            .order_by('recording__n_targets', 'when', 'recording__build_number_int', 'recording__pk')
+            .values_list('recording__n_targets', 'recording__slug', 'recording__title', 'recording__commit_sha1',
+                         'recording__build_number', 'when', 'codes', 'totals'))
+
+    groups = OrderedDict()
+    for n, slug, title, sha1, build_number, when, codes, totals in rows:
+        total = sum(totals)
+        shares = {code: (100 * count / total if total else 0) for code, count in zip(codes, totals)}
+        groups.setdefault(n, []).append({
+            'slug': slug,
+            'title': title,
+            'sha1': sha1,
+            'build_number': build_number,
+            'date': when.isoformat(),
+            'total': total,
+            'shares': shares,
+            'success': sum(shares.get(code, 0) for code in SUCCESS_CODES),
+        })
+    return [{'n_targets': n, 'recordings': recordings[-last:] if last else recordings}
+            for n, recordings in groups.items()]
+
+
+def comparison(recordings):
+    """
+    Code percentages per distance of K recordings aligned on the union of their distances and codes.
+    Built from RecordingStats fetched with one query and scattered into a (K, D, C) tensor
+    @param recordings: list of TestingRecording, the first one is the base of comparison
+    @return: dict with dists, codes, percent tensor (K, D, C) and difference tensor (K, D, C) from the base.
+        Distances a recording has no scenarios at are NaN
+    """
+    stats = {s.recording_id: s for s in RecordingStats.objects.filter(recording__in=recordings)}
+    for recording in recordings:
+        if recording.pk not in stats:
+            stats[recording.pk] = RecordingStats.update_for(recording)
+    stats = [stats[recording.pk] for recording in recordings]
+
+    dists = np.unique(np.concatenate([np.asarray(s.dists, dtype=float) for s in stats] + [np.zeros(0)]))
+    codes = np.unique(np.concatenate([np.asarray(s.codes, dtype=int) for s in stats] + [np.zeros(0, dtype=int)]))
+    counts = np.zeros((len(stats), len(dists), len(codes)))
+    for k, s in enumerate(stats):
+        if s.counts:
+            counts[k][np.ix_(np.searchsorted(dists, s.dists), np.searchsorted(codes, s.codes))] = s.counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percent = counts / counts.sum(axis=2, keepdims=True) * 100
+    return {
+        'dists': dists,
+        'codes': codes,
+        'percent': percent,
+        'difference': percent - percent[:1],
+    }
+
+
+# Results of two packs joined on scenario, served by result_pack_code_idx and result_scenario_pack_idx
+TRANSITIONS_SQL = '''
+SELECT o.code, n.code, count(*)
+FROM (SELECT scenario_id, code FROM {results} WHERE pack_id = %s) o
+FULL JOIN (SELECT scenario_id, code FROM {results} WHERE pack_id = %s) n USING (scenario_id)
+GROUP BY 1, 2
+'''
+
+REGRESSIONS_SQL = '''
+SELECT s.name, o.code, n.code, n.dist1, n.dist2, n.course1, n.course2, n.peleng1, n.peleng2
+FROM {results} o
+JOIN {results} n ON n.scenario_id = o.scenario_id AND n.pack_id = %s
+JOIN {scenarios} s ON s.id = o.scenario_id
+WHERE o.pack_id = %s AND o.code = ANY(%s) AND n.code = ANY(%s)
+ORDER BY s.name
+'''
+
+REGRESSION_COLUMNS = ('name', 'old_code', 'new_code', 'dist1', 'dist2', 'course1', 'course2', 'peleng1', 'peleng2')
+
+
+def transitions(previous, recording):
+    """
+    Counts scenarios by code in previous recording and code in recording, joining results on scenario in SQL
+    @return: dict with codes and matrix[i][j] - number of scenarios that had codes[i] and got codes[j].
+        Code None stands for scenarios missing in one of recordings
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(TRANSITIONS_SQL.format(results=ScenarioResult._meta.db_table), [previous.pk, recording.pk])
+        rows = cursor.fetchall()
+    codes = sorted({code for old, new, _ in rows for code in (old, new) if code is not None})
+    if any(code is None for old, new, _ in rows for code in (old, new)):
+        codes.append(None)
+    index = {code: i for i, code in enumerate(codes)}
+    matrix = np.zeros((len(codes), len(codes)), dtype=int)
+    for old, new, count in rows:
+        matrix[index[old], index[new]] = count
+    return {'codes': codes, 'matrix': matrix.tolist()}
+
+
+def regressions(previous, recording, old_codes=SUCCESS_CODES, new_codes=None, chunk_size=2000):
+    """
+    Streams scenarios whose code changed from one of old_codes to one of new_codes,
+    from solved to unsolved by default. Rows are read with a server-side cursor
+    @return: iterator of tuples in REGRESSION_COLUMNS order
+    """
+    if new_codes is None:
+        new_codes = [code for code, _ in STATUS if code not in SUCCESS_CODES]
+    sql = REGRESSIONS_SQL.format(results=ScenarioResult._meta.db_table, scenarios=Scenario._meta.db_table)
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, [recording.pk, previous.pk, list(old_codes), list(new_codes)])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+
+
+# Quantiles of exec_time reported per group
+EXEC_TIME_QUANTILES = (0.5, 0.9, 0.99)
+# Bins of exec_time histogram
+EXEC_TIME_BINS = 30
+# Relative change of median or p90 exec_time flagged as slowdown
+SLOWDOWN_THRESHOLD = 0.2
+# Groups with fewer scenarios in either recording are not flagged
+SLOWDOWN_MIN_SCENARIOS = 30
+
+# Exec time distribution of one pack: overall, per result code and per scenario type of any target.
+# Scenario types come from type1 and type2, unknown types are skipped like in pivot_scenario_types
+EXEC_TIME_SQL = '''
+SELECT 'all', '', count(*), percentile_cont(%(quantiles)s) WITHIN GROUP (ORDER BY exec_time), max(exec_time)
+FROM {results} WHERE pack_id = %(pack)s
+UNION ALL
+SELECT 'code', code::text, count(*), percentile_cont(%(quantiles)s) WITHIN GROUP (ORDER BY exec_time), max(exec_time)
+FROM {results} WHERE pack_id = %(pack)s
+GROUP BY code
+UNION ALL
+SELECT 'type', t.type, count(*), percentile_cont(%(quantiles)s) WITHIN GROUP (ORDER BY exec_time), max(exec_time)
+FROM {results}, unnest(ARRAY[type1, type2]) AS t(type)
+WHERE pack_id = %(pack)s AND t.type NOT IN ('', 'nan')
+GROUP BY t.type
+'''
+
+# width_bucket puts the maximum into bin bins + 1, it is moved to the last bin
+EXEC_TIME_HISTOGRAM_SQL = '''
+SELECT least(width_bucket(exec_time, 0, %(high)s, %(bins)s), %(bins)s), count(*)
+FROM {results} WHERE pack_id = %(pack)s
+GROUP BY 1
+'''
+
+
+def exec_time_stats(recording):
+    """
+    Exec time quantiles (EXEC_TIME_QUANTILES) and maximum of recording, computed with percentile_cont
+    @return: list of dicts with kind ('all', 'code' or 'type'), key, count, quantiles and max.
+        Scenarios with two targets of different types count in both types
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(EXEC_TIME_SQL.format(results=ScenarioResult._meta.db_table),
+                       {'pack': recording.pk, 'quantiles': list(EXEC_TIME_QUANTILES)})
+        rows = cursor.fetchall()
+    labels = code_labels()
+    order = {'all': 0, 'code': 1, 'type': 2}
+    stats = []
+    for kind, key, count, quantiles, maximum in rows:
+        if not count:
+            continue
+        if kind == 'code':
+            key = int(key)
+        stats.append({'kind': kind,
+                      'key': key,
+                      'label': labels.get(key, str(key)) if kind == 'code' else key,
+                      'count': count,
+                      'quantiles': quantiles,
+                      'max': maximum})
+    return sorted(stats, key=lambda s: (order[s['kind']], s['key']))
+
+
+def exec_time_histogram(recording, high, bins=EXEC_TIME_BINS):
+    """
+    Counts of exec time of recording in bins equal bins from 0 to high, computed with width_bucket
+    @return: dict with edges (bins + 1) and counts (bins)
+    """
+    counts = np.zeros(bins, dtype=int)
+    if high:
+        with connection.cursor() as cursor:
+            cursor.execute(EXEC_TIME_HISTOGRAM_SQL.format(results=ScenarioResult._meta.db_table),
+                           {'pack': recording.pk, 'high': high, 'bins': bins})
+            for bucket, count in cursor.fetchall():
+                # Bucket 0 holds negative times, there should be none
+                counts[max(bucket, 1) - 1] += count
+    return {'edges': np.linspace(0, high or 0, bins + 1).tolist(), 'counts': counts.tolist()}
+
+
+def exec_time(recording, bins=EXEC_TIME_BINS):
+    """
+    Exec time statistics and histogram of recording
+    """
+    stats = exec_time_stats(recording)
+    high = next((s['max'] for s in stats if s['kind'] == 'all'), None)
+    return {'quantiles': EXEC_TIME_QUANTILES,
+            'stats': stats,
+            'histogram': exec_time_histogram(recording, high, bins)}
+
+
+def slowdowns(previous, recording, threshold=SLOWDOWN_THRESHOLD, min_scenarios=SLOWDOWN_MIN_SCENARIOS):
+    """
+    Compares exec time distributions of two recordings group by group. A group is flagged when its median
+    or p90 changed by more than threshold relative to previous and both recordings have at least
+    min_scenarios scenarios in it, smaller groups are too noisy
+    @return: list of dicts with kind, key, label, count, quantiles of both recordings,
+        relative change of every quantile and flag: 'slower', 'faster' or ''
+    """
+    old = {(s['kind'], s['key']): s for s in exec_time_stats(previous)}
+    report = []
+    for new in exec_time_stats(recording):
+        before = old.get((new['kind'], new['key']))
+        if before is None:
+            continue
+        change = [(n - o) / o if o else None for o, n in zip(before['quantiles'], new['quantiles'])]
+        flag = ''
+        if min(before['count'], new['count']) >= min_scenarios:
+            # Median and p90
+            shifts = [c for c in change[:2] if c is not None]
+            if any(c >= threshold for c in shifts):
+                flag = 'slower'
+            elif any(c <= -threshold for c in shifts):
+                flag = 'faster'
+        report.append({'kind': new['kind'],
+                       'key': new['key'],
+                       'label': new['label'],
+                       'count': [before['count'], new['count']],
+                       'quantiles': [before['quantiles'], new['quantiles']],
+                       'change': change,
+                       'flag': flag})
+    return report
+
+
+def success_rate(recording, **lookups):
+    """
+    Share of solved scenarios of recording among scenarios matching lookups on Scenario geometry, counted in SQL.
+    Example: success_rate(recording, min_dist__lt=2, max_vel__gt=15)
+    @param lookups: Scenario field lookups
+    @return: dict with total and solved scenarios and success percentage, which is None if there are none
+    """
+    counts = (ScenarioResult.objects.filter(pack=recording, **{f'scenario__{k}': v for k, v in lookups.items()})
+              .aggregate(total=Count('pk'), solved=Count('pk', filter=Q(code__in=SUCCESS_CODES))))
+    counts['success'] = 100 * counts['solved'] / counts['total'] if counts['total'] else None
+    return counts
+
+
+def success_share(percent, codes):
+    """
+    Sums percentages of SUCCESS_CODES along the last axis of percent
+    """
+    share = percent[..., np.isin(codes, SUCCESS_CODES)].sum(axis=-1)
+    share[np.isnan(percent).all(axis=-1)] = np.nan
+    return share
+
+
+def nan_to_none(array):
+    """
+    Converts array to nested lists with NaN replaced by None, so it can be serialized to JSON
+    """
+    result = np.asarray(array, dtype=object)
+    result[np.isnan(np.asarray(array, dtype=float))] = None
+    return result.tolist()
+
+
+def code_labels():
+    return {code: label for code, label in STATUS}
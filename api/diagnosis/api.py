@@ -0,0 +1,279 @@
+"""
+Versioned JSON API with chart data of recordings.
+Responses are gzip-compressed and carry ETags derived from recording versions and query parameters,
+so clients revalidate with If-None-Match and unchanged data costs a 304.
+"""
+import csv
+from urllib.parse import urlencode
+
+from django.http import JsonResponse, Http404, StreamingHttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag, require_GET, require_POST
+
+from . import analytics, jobs, uploads
+from .analytics import nan_to_none
+from .forms import UploadFileForm
+from .models import TestingRecording, ScenarioResult, ScenarioResultPayload, PROCESS_RECORDING
+
+# Digits kept in percentages
+PRECISION = 3
+# Upper limit of histogram bins
+MAX_BINS = 1000
+
+
+def _versions(*slugs):
+    versions = dict(TestingRecording.objects.filter(slug__in=slugs).values_list('slug', 'version'))
+    if len(versions) != len(set(slugs)):
+        return None
+    return [f'{slug}.{versions[slug]}' for slug in slugs]
+
+
+def _query(request, exclude=()):
+    """
+    Query parameters in a stable order, e.g. bins=20&kind=a. Responses depend on them, so do ETags
+    """
+    query = urlencode(sorted((key, value) for key, values in request.GET.lists() if key not in exclude
+                             for value in values))
+    return '?' + query if query else ''
+
+
+def _recording_etag(request, slug):
+    versions = _versions(slug)
+    return f'{request.resolver_match.url_name}-{versions[0]}{_query(request)}' if versions else None
+
+
+def _scenario_etag(request, slug, name):
+    etag = _recording_etag(request, slug)
+    return f'{etag}-{name}' if etag else None
+
+
+def _compare_etag(request, slug):
+    versions = _versions(slug, request.GET.get('prev', ''))
+    if versions is None:
+        return None
+    return f'{request.resolver_match.url_name}-' + '-'.join(versions) + _query(request, exclude=('prev',))
+
+
+def _frame_response(df):
+    """
+    Serializes table with its index as the first column:
+    {"columns": [index name, column names...], "rows": [[index value, values...], ...]}
+    """
+    df = df.round(PRECISION)
+    values = nan_to_none(df.values.astype(float))
+    response = JsonResponse({'columns': [str(df.index.name or '')] + list(map(str, df.columns.tolist())),
+                             'rows': [[index] + row for index, row in zip(df.index.tolist(), values)]})
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+@gzip_page
+@etag(_recording_etag)
+def recording_chart(request, slug):
+    """
+    Code percentage per distance to the nearest target
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    return _frame_response(obj.to_dataframe())
+
+
+@require_GET
+@gzip_page
+@etag(_recording_etag)
+def recording_pivot(request, slug):
+    """
+    Code percentage per scenario type. Counts the same rows as the chart, rows of unknown scenarios included
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    pivot = obj.pivot_scenario_types()
+    if pivot is None:
+        raise Http404("Report file is missing")
+    return _frame_response(pivot.rename_axis(columns=None))
+
+
+@require_GET
+@gzip_page
+@etag(_compare_etag)
+def recording_compare(request, slug):
+    """
+    Difference of code percentages per distance between recording and recording given by ?prev=<slug>
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    prev = get_object_or_404(TestingRecording, slug=request.GET.get('prev', ''))
+    return _frame_response(obj.compare(prev))
+
+
+@require_GET
+@gzip_page
+@etag(_compare_etag)
+def recording_transitions(request, slug):
+    """
+    Scenario counts by code in recording ?prev=<slug> (rows) and code in this recording (columns)
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    prev = get_object_or_404(TestingRecording, slug=request.GET.get('prev', ''))
+    result = analytics.transitions(prev, obj)
+    labels = analytics.code_labels()
+    result['labels'] = [labels.get(code, str(code)) if code is not None else None for code in result['codes']]
+    response = JsonResponse(result)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+@gzip_page
+@etag(_recording_etag)
+def recording_exec_time(request, slug):
+    """
+    Exec time quantiles per result code and scenario type and exec time histogram. ?bins= sets histogram bins
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    try:
+        bins = int(request.GET.get('bins', analytics.EXEC_TIME_BINS))
+    except ValueError:
+        return HttpResponseBadRequest("bins must be integer")
+    if not 0 < bins <= MAX_BINS:
+        return HttpResponseBadRequest(f"bins must be from 1 to {MAX_BINS}")
+    response = JsonResponse(analytics.exec_time(obj, bins))
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+@gzip_page
+@etag(_compare_etag)
+def recording_slowdowns(request, slug):
+    """
+    Exec time quantiles of recording ?prev=<slug> and this recording per result code and scenario type,
+    with significant shifts flagged
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    prev = get_object_or_404(TestingRecording, slug=request.GET.get('prev', ''))
+    response = JsonResponse({'quantiles': analytics.EXEC_TIME_QUANTILES,
+                             'threshold': analytics.SLOWDOWN_THRESHOLD,
+                             'min_scenarios': analytics.SLOWDOWN_MIN_SCENARIOS,
+                             'groups': analytics.slowdowns(prev, obj)})
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@require_GET
+@gzip_page
+@etag(_scenario_etag)
+def recording_scenario(request, slug, name):
+    """
+    Result of one scenario of recording with its navigation report and command
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    result = (ScenarioResult.objects.filter(pack=obj, scenario__name=name)
+              .values('pk', 'code', 'exec_time', 'dist1', 'dist2', 'course1', 'course2', 'peleng1', 'peleng2',
+                      'type1', 'type2')
+              .first())
+    if result is None:
+        raise Http404("No such scenario in recording")
+    payload = ScenarioResultPayload.objects.filter(result_id=result.pop('pk')).values('nav_report', 'command').first()
+    result.update(payload or {'nav_report': '', 'command': ''})
+    result['name'] = name
+    result['status'] = analytics.code_labels().get(result['code'], str(result['code']))
+    response = JsonResponse(result)
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+@require_GET
+@gzip_page
+def recording_regressions(request, slug):
+    """
+    CSV of scenarios that were solved in recording ?prev=<slug> and are not solved in this one.
+    Codes can be chosen with ?from=0&to=2, both repeatable
+    """
+    obj = get_object_or_404(TestingRecording, slug=slug)
+    prev = get_object_or_404(TestingRecording, slug=request.GET.get('prev', ''))
+    try:
+        old_codes = [int(code) for code in request.GET.getlist('from')] or analytics.SUCCESS_CODES
+        new_codes = [int(code) for code in request.GET.getlist('to')] or None
+    except ValueError:
+        return HttpResponseBadRequest("Codes must be integers")
+    writer = csv.writer(_Echo())
+    rows = analytics.regressions(prev, obj, old_codes, new_codes)
+    response = StreamingHttpResponse((writer.writerow(row) for row in _with_header(rows)),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="regressions_{prev.pk}_{obj.pk}.csv"'
+    return response
+
+
+def _with_header(rows):
+    yield analytics.REGRESSION_COLUMNS
+    yield from rows
+
+
+@csrf_exempt
+@require_POST
+def upload_recording(request):
+    """
+    Stores uploaded stats file and queues its processing. Responds 202 with recording id and progress url
+    without waiting for the processing. Files identical to an existing recording are handled according to
+    DUPLICATE_UPLOAD_POLICY: 409 for reject, 200 with the existing recording for link. Example:
+    curl -F file=@stats.csv -F commit_sha1=... -F build_number=... <host>/api/v1/recordings/
+    """
+    hashing = uploads.hash_uploads(request)
+    form = UploadFileForm(request.POST, request.FILES, content_sha256=hashing.digests.get('file'))
+    if not form.is_valid():
+        if form.has_error('file', 'duplicate'):
+            return JsonResponse({'errors': form.errors, 'duplicate_of': form.duplicate_of.pk}, status=409)
+        return JsonResponse({'errors': form.errors}, status=400)
+    obj, created = form.save()
+    progress_url = reverse('api_progress', kwargs={'pk': obj.pk})
+    # Linked duplicate has been processed or queued before
+    response = JsonResponse({'id': obj.pk, 'progress_url': progress_url, 'created': created},
+                            status=202 if created else 200)
+    response['Location'] = progress_url
+    return response
+
+
+@require_GET
+def recording_progress(request, pk):
+    """
+    Processing state of recording: job status, stage, processed and total rows, last error
+    """
+    obj = get_object_or_404(TestingRecording.objects.only('pk', 'slug', 'processed'), pk=pk)
+    job = obj.job_set.filter(kind=PROCESS_RECORDING).order_by('-pk').first()
+    data = {'id': obj.pk, 'processed': obj.processed}
+    if job is not None:
+        data.update({'status': job.get_status_display(),
+                     'stage': job.stage,
+                     'stage_display': job.get_stage_display(),
+                     'rows_done': job.rows_done,
+                     'rows_total': job.rows_total,
+                     'attempts': job.attempts,
+                     'max_attempts': job.max_attempts,
+                     # Last line of traceback
+                     'error': job.error.strip().splitlines()[-1] if job.error.strip() else ''})
+    if obj.processed:
+        data['details_url'] = reverse('details', kwargs={'slug': obj.slug})
+    response = JsonResponse(data)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+def batch_progress(request, batch):
+    """
+    Aggregate progress of jobs queued together, see jobs.batch_progress
+    """
+    data = jobs.batch_progress(batch)
+    if data is None:
+        raise Http404("No such batch")
+    response = JsonResponse(data)
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -4,8 +4,8 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 
-def plot_graph_normal(df: pd.DataFrame, title=''):
-    fig = plt.figure(figsize=(10, 6), dpi=200)
+def plot_graph_normal(df: pd.DataFrame, title='', dpi=200):
+    fig = plt.figure(figsize=(10, 6), dpi=dpi)
     style = itertools.cycle(['b', 'r', 'y--', 'o--', 'g', 'g--'])
 
     plt.plot(df.index, df[df.columns[0]], next(style), label=df.columns[0], linewidth=3)
@@ -23,8 +23,8 @@ def plot_graph_normal(df: pd.DataFrame, title=''):
     return fig
 
 
-def plot_minister_mode(df: pd.DataFrame, title=''):
-    fig = plt.figure(figsize=(10, 6), dpi=200)
+def plot_minister_mode(df: pd.DataFrame, title='', dpi=200):
+    fig = plt.figure(figsize=(10, 6), dpi=dpi)
     code0 = df[0] + df[1] + df[5]
     plt.plot(df.index, code0, 'b', label="Код 0", linewidth=3)
     plt.fill_between(df.index, code0, 100, color='orange', alpha=0.5)
@@ -0,0 +1,117 @@
+"""
+Scenario folder names encode scenario geometry:
+<prefix>_<dist1..distN>_<vel1..velN>_<vel_our>_<course1..courseN>
+Scenarios with fewer targets than the set keep zero distance, velocity and course for absent targets.
+"""
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+
+def scenario_names(datadirs):
+    """
+    Strips path from scenario folders
+    @param datadirs: pd.Series of folder paths
+    @rtype: pd.Series
+    """
+    names = [d.rpartition('/')[2] for d in datadirs.fillna('').astype(str).tolist()]
+    return pd.Series(names, index=datadirs.index, dtype=object)
+
+
+def geometry_columns(n_targets):
+    """
+    Names of geometry fields encoded in folder names of scenarios with n_targets targets
+    @rtype: list
+    """
+    targets = range(1, n_targets + 1)
+    return [f'dist{i}' for i in targets] + [f'vel{i}' for i in targets] + ['vel_our'] + [f'course{i}' for i in targets]
+
+
+def parse_datadirs(datadirs):
+    """
+    Parses every field encoded in scenario folder names in one pass of the pandas C parser
+    @param datadirs: pd.Series of scenario folder paths or names
+    @return: pd.DataFrame with the same index and float columns dist1..distN, vel1..velN, vel_our, course1..courseN,
+        where N is the largest number of targets found, n_targets - number of targets with non-zero distance
+        and dist - distance to the nearest target. Fields of unparsable names are NaN
+    """
+    text = '\n'.join(scenario_names(datadirs).tolist())
+    # Number of fields in every name, including prefix
+    raw = np.frombuffer(text.encode(), dtype=np.uint8)
+    line_ends = np.append(np.flatnonzero(raw == ord('\n')), len(raw)) if len(datadirs) else []
+    n_fields = np.diff(np.searchsorted(np.flatnonzero(raw == ord('_')), line_ends), prepend=0) + 1
+    k_max = int(n_fields.max(initial=1))
+    n_max = max((k_max - 2) // 3, 0)
+    columns = geometry_columns(n_max)
+
+    values = np.full((len(datadirs), len(columns)), np.nan)
+    if n_max:
+        fields = pd.read_csv(io.StringIO(text), sep='_', header=None, names=range(k_max),
+                             usecols=range(1, k_max), quoting=csv.QUOTE_NONE, skip_blank_lines=False,
+                             low_memory=False)
+        fields = fields.apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        n_targets = (n_fields - 2) // 3
+        for n in np.unique(n_targets[n_targets > 0]):
+            rows = np.flatnonzero(n_targets == n)
+            block = np.zeros((len(rows), len(columns)))
+            block[:, [columns.index(c) for c in geometry_columns(n)]] = fields[rows, :3 * n + 1]
+            # A name with an unparsable field has no geometry at all rather than some of its targets
+            block[np.isnan(block).any(axis=1)] = np.nan
+            values[rows] = block
+
+    result = pd.DataFrame(values, index=datadirs.index, columns=columns)
+    dists = values[:, :n_max]
+    present = dists > 0
+    result['n_targets'] = present.sum(axis=1)
+    dist = np.where(present, dists, np.inf).min(axis=1, initial=np.inf)
+    dist[~present.any(axis=1)] = 0.0
+    dist[np.isnan(dists).any(axis=1) | (n_max == 0)] = np.nan
+    result['dist'] = dist
+    return result
+
+
+def _array_literals(values, present):
+    """
+    Formats rows of values as Postgres array literals, e.g. '{1.5,2.0}', keeping only present elements
+    @param values: 2D float array
+    @param present: boolean mask of the same shape
+    @rtype: np.ndarray of str
+    """
+    literals = np.full(len(values), '', dtype=object)
+    for j in range(values.shape[1]):
+        element = np.where(present[:, j], pd.Series(values[:, j]).astype(str).to_numpy(dtype=object), '')
+        separator = np.where((literals != '') & present[:, j], ',', '')
+        literals = literals + separator + element
+    return '{' + literals + '}'
+
+
+def scenario_geometry(datadirs):
+    """
+    Geometry fields of Scenario parsed from folder names, for all names at once.
+    Only targets with non-zero distance are included in arrays
+    @param datadirs: pd.Series of scenario folder paths or names
+    @return: pd.DataFrame with the same index and columns num_targets, dists, vels, courses (Postgres array
+        literals), vel_our, min_dist - distance to the nearest target and max_vel - speed of the fastest target.
+        min_dist and max_vel are NaN for names without targets
+    """
+    parsed = parse_datadirs(datadirs)
+    n_max = sum(column.startswith('dist') and column != 'dist' for column in parsed.columns)
+    targets = range(1, n_max + 1)
+    dists = parsed[[f'dist{i}' for i in targets]].to_numpy()
+    vels = parsed[[f'vel{i}' for i in targets]].to_numpy()
+    courses = parsed[[f'course{i}' for i in targets]].to_numpy()
+    present = dists > 0
+    with np.errstate(invalid='ignore'):
+        max_vel = np.where(present, vels, -np.inf).max(axis=1, initial=-np.inf)
+    max_vel[~present.any(axis=1)] = np.nan
+    return pd.DataFrame({
+        'num_targets': parsed['n_targets'].to_numpy(),
+        'dists': _array_literals(dists, present),
+        'vels': _array_literals(vels, present),
+        'courses': _array_literals(courses, present),
+        'vel_our': parsed['vel_our'].fillna(0).to_numpy() if n_max else 0.0,
+        'min_dist': parsed['dist'].where(parsed['n_targets'] > 0).to_numpy(),
+        'max_vel': max_vel,
+    }, index=datadirs.index)
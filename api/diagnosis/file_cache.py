@@ -0,0 +1,326 @@
+"""
+Stats file I/O and content addressed cache of parsed stats files.
+Uploads are converted once at ingest into canonical typed Parquet files, which analytics read.
+Other files are parsed once into MEDIA_ROOT/cache/<sha256>.parquet, which is bounded by size and
+dropped once the canonical file exists. Loaded frames are kept in an in-process LRU bounded by their memory size.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import fastparquet
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(settings.MEDIA_ROOT, 'cache')
+# Memory limit for loaded frames of one process
+MAX_BYTES = int(os.getenv('FRAME_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Disk limit for parsed files in CACHE_DIR, least recently read ones are removed first
+DISK_MAX_BYTES = int(os.getenv('FILE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+counters = Counter()
+
+_lock = threading.Lock()
+_frames = OrderedDict()
+_frames_bytes = 0
+_digests = {}
+
+# Columns and dtypes of canonical stats file, type1 and type2 go last
+CANONICAL_COLUMNS = {
+    'datadir': 'str',
+    'code': 'Int16',
+    'exec_time': 'float64',
+    'nav_report': 'str',
+    'command': 'str',
+    'dist1': 'float64',
+    'dist2': 'float64',
+    'course1': 'float64',
+    'course2': 'float64',
+    'peleng1': 'float64',
+    'peleng2': 'float64',
+    'type1': 'str',
+    'type2': 'str',
+}
+# Columns turned categorical in loaded frames. Parquet keeps them plain: fastparquet can't append
+# row groups with different categories
+CATEGORICAL_COLUMNS = ('code', 'type1', 'type2')
+
+
+def file_digest(path):
+    """
+    SHA-256 of file content. Digests are remembered per path, size and modification time
+    @param path: file path
+    @return: hex digest
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = _digests[key] = h.hexdigest()
+    return digest
+
+
+def read_stats_file(path):
+    """
+    Parses stats file according to its extension
+    @param path: csv, xlsx or parquet file path
+    @rtype: pd.DataFrame
+    """
+    try:
+        file_extension = path.split('.')[-1]
+        if file_extension == 'parquet':
+            return pd.read_parquet(path, engine='fastparquet')
+        elif file_extension == 'xlsx':
+            return pd.read_excel(path, engine='openpyxl')
+        else:
+            return pd.read_csv(path)
+    except ValueError:
+        return pd.read_csv(path)
+
+
+def csv_chunk_rows(path, chunk_bytes):
+    """
+    Estimates how many CSV rows take chunk_bytes of file from the average line length of the file head.
+    Row length varies a lot with nav_report and command texts, so chunks are sized in bytes rather than rows
+    @rtype: int
+    """
+    with open(path, 'rb') as f:
+        head = f.read(1024 * 1024)
+    row_bytes = len(head) / max(head.count(b'\n'), 1)
+    return max(int(chunk_bytes / row_bytes), 1)
+
+
+def iter_stats_file(path, chunk_bytes, columns=None):
+    """
+    Reads stats file piece by piece: CSV in chunks of about chunk_bytes of file, Parquet by row group.
+    Canonical files have a row group per ingest chunk. XLSX can't be streamed and is read whole
+    @param path: csv, xlsx or parquet file path
+    @param chunk_bytes: CSV bytes per chunk, parsed rows take a few times more memory
+    @param columns: columns to read, all by default
+    @return: iterator of pd.DataFrame
+    """
+    file_extension = path.split('.')[-1]
+    if file_extension == 'parquet':
+        yield from fastparquet.ParquetFile(path).iter_row_groups(columns=columns)
+    elif file_extension == 'xlsx':
+        yield pd.read_excel(path, engine='openpyxl', usecols=columns)
+    else:
+        yield from pd.read_csv(path, chunksize=csv_chunk_rows(path, chunk_bytes), usecols=columns)
+
+
+def count_rows(path):
+    """
+    Counts rows of stats file without parsing it. For CSV it counts lines, so quoted line breaks
+    make it an estimate
+    @return: number of rows or None for XLSX
+    """
+    file_extension = path.split('.')[-1]
+    if file_extension == 'parquet':
+        return fastparquet.ParquetFile(path).count()
+    elif file_extension == 'xlsx':
+        return None
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    # Header line doesn't count, the last line may lack line break
+    return max(lines - 1 + (last != b'\n'), 0)
+
+
+def canonical_frame(df):
+    """
+    Brings stats file chunk to CANONICAL_COLUMNS and their dtypes, missing columns are filled with nulls
+    @rtype: pd.DataFrame
+    """
+    columns = {}
+    for column, dtype in CANONICAL_COLUMNS.items():
+        values = df[column] if column in df.columns else pd.Series(np.nan, index=df.index)
+        if dtype == 'str':
+            columns[column] = values.astype(str).astype(object).where(values.notna(), None)
+        else:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype(dtype)
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+
+class CanonicalWriter:
+    """
+    Writes canonical Parquet file chunk by chunk, a row group per chunk.
+    The file replaces path atomically on successful exit from with block
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.rows = 0
+
+    def write(self, chunk):
+        df = canonical_frame(chunk)
+        if self.rows and df.empty:
+            return
+        fastparquet.write(self.tmp_path, df, write_index=False, append=self.rows > 0,
+                          object_encoding={column: 'utf8' for column, dtype in CANONICAL_COLUMNS.items()
+                                           if dtype == 'str'})
+        self.rows += len(df)
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            if not self.rows:
+                self.write(pd.DataFrame(columns=list(CANONICAL_COLUMNS)))
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def as_categorical(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def load_frame(path):
+    """
+    Loads stats file through the cache. Parquet files are read directly, others are parsed once
+    and cached as Parquet. Returned frame shares data with the cached one:
+    adding columns is fine, modifying values in place is not
+    @param path: stats file path
+    @rtype: pd.DataFrame
+    """
+    digest = file_digest(path)
+    with _lock:
+        entry = _frames.get(digest)
+        if entry is not None:
+            _frames.move_to_end(digest)
+            counters['memory_hits'] += 1
+            return entry[0].copy(deep=False)
+
+    cached_path = os.path.join(CACHE_DIR, digest + '.parquet')
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path, engine='fastparquet')
+        counter = 'disk_hits'
+    else:
+        df = _read_cached(cached_path)
+        counter = 'disk_hits'
+        if df is None:
+            df = read_stats_file(path)
+            counter = 'misses'
+            _write_parquet(df, cached_path)
+    df = as_categorical(df)
+
+    with _lock:
+        counters[counter] += 1
+    _remember(digest, df)
+    return df.copy(deep=False)
+
+
+def drop_cached(path, digest=None):
+    """
+    Removes parsed copy of stats file from CACHE_DIR, e.g. once its canonical file is written
+    @param path: stats file path
+    @param digest: SHA-256 of the file if known, e.g. TestingRecording.content_sha256, saves reading the file
+    """
+    try:
+        os.remove(os.path.join(CACHE_DIR, (digest or file_digest(path)) + '.parquet'))
+    except FileNotFoundError:
+        return
+    with _lock:
+        counters['disk_evictions'] += 1
+
+
+def stats():
+    """
+    Cache counters of current process
+    @rtype: dict
+    """
+    with _lock:
+        return {'memory_hits': counters['memory_hits'],
+                'disk_hits': counters['disk_hits'],
+                'misses': counters['misses'],
+                'evictions': counters['evictions'],
+                'disk_evictions': counters['disk_evictions'],
+                'entries': len(_frames),
+                'bytes': _frames_bytes,
+                'max_bytes': MAX_BYTES}
+
+
+def _write_parquet(df, path):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        df.to_parquet(tmp_path, engine='fastparquet', index=False)
+        os.replace(tmp_path, path)
+    except (ValueError, TypeError, OSError):
+        logger.warning("Couldn't cache %s as parquet", path, exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _evict_disk()
+
+
+def _read_cached(cached_path):
+    """
+    Reads parsed file from CACHE_DIR and marks it as recently read
+    @return: pd.DataFrame or None if it isn't cached or was evicted meanwhile
+    """
+    try:
+        df = pd.read_parquet(cached_path, engine='fastparquet')
+        os.utime(cached_path)
+    except FileNotFoundError:
+        return None
+    return df
+
+
+def _evict_disk():
+    """
+    Removes least recently read files from CACHE_DIR until they fit in DISK_MAX_BYTES
+    """
+    files = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith('.parquet'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= DISK_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        with _lock:
+            counters['disk_evictions'] += 1
+
+
+def _remember(digest, df):
+    global _frames_bytes
+    size = int(df.memory_usage(deep=True).sum())
+    if size > MAX_BYTES:
+        return
+    with _lock:
+        if digest in _frames:
+            return
+        _frames[digest] = (df, size)
+        _frames_bytes += size
+        while _frames_bytes > MAX_BYTES:
+            _, (_, evicted_size) = _frames.popitem(last=False)
+            _frames_bytes -= evicted_size
+            counters['evictions'] += 1
@@ -1,5 +1,8 @@
 from django import forms
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
+from . import uploads
 from .models import TestingRecording
 
 
@@ -9,12 +12,76 @@ class UploadFileForm(forms.Form):
     build_number = forms.CharField(max_length=20, required=False)
     file = forms.FileField()
 
+    def __init__(self, *args, content_sha256=None, policy=None, **kwargs):
+        """
+        @param content_sha256: file digest computed by uploads.HashingUploadHandler, the file is hashed if None
+        @param policy: duplicate upload policy, uploads.DUPLICATE_UPLOAD_POLICY by default
+        """
+        super().__init__(*args, **kwargs)
+        self.content_sha256 = content_sha256
+        self.policy = policy or uploads.DUPLICATE_UPLOAD_POLICY
+        self.duplicate_of = None
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if self.content_sha256 is None:
+            self.content_sha256 = uploads.file_sha256(file)
+        self.duplicate_of = TestingRecording.objects.filter(content_sha256=self.content_sha256,
+                                                            duplicate_of=None).first()
+        if self.duplicate_of is not None and self.policy == uploads.REJECT:
+            raise forms.ValidationError("Файл уже загружен: %(title)s", code='duplicate',
+                                        params={'title': self.duplicate_of})
+        return file
+
+    def save(self):
+        """
+        Creates recording, its processing is queued for background worker.
+        An identical file uploaded before is linked instead, unless policy is uploads.FORCE
+        @return: recording and whether it was created
+        @rtype: (TestingRecording, bool)
+        """
+        if self.duplicate_of is not None and self.policy != uploads.FORCE:
+            return self.duplicate_of, False
+        obj = TestingRecording()
+        obj.date = timezone.now()
+        obj.file = self.cleaned_data['file']
+        obj.title = self.cleaned_data['title']
+        obj.commit_sha1 = self.cleaned_data['commit_sha1']
+        obj.build_number = self.cleaned_data['build_number']
+        obj.content_sha256 = self.content_sha256
+        obj.duplicate_of = self.duplicate_of
+        try:
+            with transaction.atomic():
+                obj.save()
+        except IntegrityError:
+            # The same file was uploaded concurrently
+            obj.file.delete(save=False)
+            return TestingRecording.objects.get(content_sha256=self.content_sha256, duplicate_of=None), False
+        return obj, True
+
 
 class UploadMetaFileForm(forms.Form):
     n_targets = forms.IntegerField()
     metafile = forms.FileField()
 
 
+class RecordingFilterForm(forms.Form):
+    n_targets = forms.IntegerField(required=False, min_value=1, label='Целей')
+    build_from = forms.IntegerField(required=False, label='Сборка с')
+    build_to = forms.IntegerField(required=False, label='Сборка по')
+    date_from = forms.DateField(required=False, label='Дата с', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label='Дата по', widget=forms.DateInput(attrs={'type': 'date'}))
+    # Keyset pagination cursor: pk of the last recording on previous page
+    before = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+
 class ComparationForm(forms.Form):
     prev = forms.ModelChoiceField(queryset=TestingRecording.objects.order_by('-pk'), required=True, to_field_name='slug')
     obj = forms.ModelChoiceField(queryset=TestingRecording.objects.order_by('-pk'), required=True, to_field_name='slug')
+
+
+class MultiComparationForm(forms.Form):
+    base = forms.ModelChoiceField(queryset=TestingRecording.objects.order_by('-pk'), required=True,
+                                  to_field_name='slug')
+    others = forms.ModelMultipleChoiceField(queryset=TestingRecording.objects.order_by('-pk'), required=True,
+                                            to_field_name='slug')
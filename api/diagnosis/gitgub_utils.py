@@ -1,21 +1,75 @@
+"""
+GitHub API client. One pooled session per process, every request has a timeout
+"""
+import logging
+import os
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+logger = logging.getLogger(__name__)
 
-def get_commit(repo_url, commit_sha1, token):
-    with requests.Session() as session:
-        session.headers = {'Authorization': f'token {token}',
-                           'accept': 'application/vnd.github.v3+json',
-                           'User-Agent': 'Awesome-Octocat-App'}
+# Seconds to connect and to wait for response
+TIMEOUT = (float(os.getenv('GITHUB_CONNECT_TIMEOUT', 3)), float(os.getenv('GITHUB_READ_TIMEOUT', 10)))
+# Connection errors and 5xx are retried, read timeouts are not: a hung GitHub would multiply them
+RETRIES = Retry(total=3, read=0, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+
+_lock = threading.Lock()
+_session = None
+# repo_url -> commits_url of repository descriptor
+_commits_urls = {}
 
-        result = session.get(url=repo_url)
-        if not result.ok or result.status_code != 200:
-            return None
 
-        repo_json = result.json()
-        commits_url = repo_json['commits_url']
-        result = session.get(url=commits_url.replace('{/sha}', '/'+commit_sha1))
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update({'accept': 'application/vnd.github.v3+json',
+                                     'User-Agent': 'Awesome-Octocat-App'})
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=RETRIES)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
 
-        if result.ok and result.status_code == 200:
-            return result.json()
 
+def _get_json(url, token):
+    headers = {'Authorization': f'token {token}'} if token else {}
+    try:
+        result = get_session().get(url=url, headers=headers, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning("GitHub request %s failed: %s", url, e)
+        return None
+    if result.status_code != 200:
+        logger.warning("GitHub request %s returned %s", url, result.status_code)
+        return None
+    return result.json()
+
+
+def get_commits_url(repo_url, token):
+    """
+    Reads commits_url from repository descriptor, fetched once per process
+    """
+    commits_url = _commits_urls.get(repo_url)
+    if commits_url is None:
+        repo_json = _get_json(repo_url, token)
+        if repo_json is None:
+            return None
+        commits_url = _commits_urls[repo_url] = repo_json['commits_url']
+    return commits_url
+
+
+def get_commit(repo_url, commit_sha1, token):
+    """
+    Fetches commit from GitHub API
+    @param repo_url: repository API url, e.g. https://api.github.com/repos/<owner>/<repo>
+    @return: commit json or None if GitHub is unavailable or has no such commit
+    """
+    if not repo_url:
+        return None
+    commits_url = get_commits_url(repo_url, token)
+    if commits_url is None:
         return None
+    return _get_json(commits_url.replace('{/sha}', '/' + commit_sha1), token)
@@ -0,0 +1,187 @@
+import contextlib
+import datetime
+import logging
+import threading
+import time
+import traceback
+import uuid
+
+from django.db import transaction, connection, DatabaseError
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Job, PROCESS_RECORDING, LOAD_SCENARIOS_SET
+
+logger = logging.getLogger(__name__)
+
+# Delay before the first retry, doubled on every next attempt
+RETRY_BASE_DELAY = datetime.timedelta(seconds=30)
+# Running jobs touch `updated` this often while their handler works
+HEARTBEAT_INTERVAL = datetime.timedelta(seconds=30)
+# Running jobs without heartbeat for this long are considered lost with their worker and are claimed again
+STALE_AFTER = datetime.timedelta(minutes=5)
+
+HANDLERS = {}
+
+
+class Interrupted(BaseException):
+    """
+    Raised in worker process stopped by SIGTERM. Job being executed is put back to queue
+    """
+
+
+def handler(kind):
+    """
+    Registers function as handler for jobs of given kind
+    @param kind: job kind
+    """
+
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+@handler(PROCESS_RECORDING)
+def process_recording(job):
+    job.recording.process(progress=job.report)
+
+
+@handler(LOAD_SCENARIOS_SET)
+def load_scenarios_set(job):
+    job.scenarios_set.load_metafile()
+
+
+def claim_job():
+    """
+    Takes the next due job from queue. Concurrent workers skip rows locked by each other
+    @rtype: Job or None
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (Job.objects.select_for_update(skip_locked=True)
+               .annotate(heartbeat=Coalesce('updated', 'started'))
+               .filter(Q(status=Job.QUEUED, run_after__lte=now) |
+                       Q(status=Job.RUNNING, heartbeat__lt=now - STALE_AFTER))
+               .order_by('run_after', 'pk')
+               .first())
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started = job.updated = now
+        job.stage, job.rows_done, job.rows_total = '', 0, None
+        job.save(update_fields=['status', 'attempts', 'started', 'updated', 'stage', 'rows_done', 'rows_total'])
+    return job
+
+
+@contextlib.contextmanager
+def heartbeat(job):
+    """
+    Touches job's `updated` every HEARTBEAT_INTERVAL from a thread, so the job isn't claimed as stale
+    while its handler works without reporting progress
+    @type job: Job
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                try:
+                    Job.objects.filter(pk=job.pk).update(updated=timezone.now())
+                except DatabaseError:
+                    logger.warning("Heartbeat of job %s failed", job, exc_info=True)
+                    connection.close()
+        finally:
+            # The thread has its own connection
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Executes job and records its outcome. Failed jobs are retried with exponential backoff
+    until max_attempts is reached
+    @type job: Job
+    """
+    started = time.monotonic()
+    try:
+        with heartbeat(job):
+            HANDLERS[job.kind](job)
+    except Interrupted:
+        # Worker is stopping, the job runs again in another one without losing an attempt
+        job.status = Job.QUEUED
+        job.attempts -= 1
+        job.run_after = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'run_after'])
+        logger.info("Job %s interrupted and queued again", job)
+        raise
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = Job.FAILED
+        logger.exception("Job %s failed on attempt %d", job, job.attempts)
+    else:
+        job.status = Job.DONE
+        job.error = ''
+    job.duration = time.monotonic() - started
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'run_after', 'duration', 'finished', 'error'])
+    logger.info("Job %s finished in %.1f s with status %s", job, job.duration, job.get_status_display())
+
+
+def reprocess(recordings):
+    """
+    Queues processing of recordings as one batch. Jobs are executed by run_worker processes,
+    so concurrency is limited by their number and the web process only inserts rows.
+    Recordings stay processed and visible, their results are replaced in one transaction per recording
+    @param recordings: TestingRecording queryset
+    @return: batch id and number of queued recordings. Recordings whose file is missing are skipped
+    """
+    recordings = [r for r in recordings.only('pk', 'file') if r.file and r.file.storage.exists(r.file.name)]
+    batch = uuid.uuid4()
+    with transaction.atomic():
+        # Recordings already waiting in queue join the batch instead of being queued twice.
+        # Running jobs may have read the old file, those recordings get a follow-up job
+        queued = Job.objects.filter(kind=PROCESS_RECORDING, status=Job.QUEUED, recording__in=recordings)
+        queued_ids = set(queued.values_list('recording_id', flat=True))
+        queued.update(batch=batch)
+        Job.objects.bulk_create([Job(kind=PROCESS_RECORDING, recording=r, batch=batch)
+                                 for r in recordings if r.pk not in queued_ids])
+    logger.info("Batch %s of %d recordings queued", batch, len(recordings))
+    return batch, len(recordings)
+
+
+def batch_progress(batch):
+    """
+    Aggregate progress of jobs of batch
+    @return: dict with total and per-status job counts, rows done and total of running jobs and
+        failed jobs, None for unknown batch
+    """
+    jobs = Job.objects.filter(batch=batch)
+    counts = dict(jobs.values_list('status').annotate(n=Count('pk')).order_by())
+    if not counts:
+        return None
+    rows = jobs.filter(status=Job.RUNNING).aggregate(done=Sum('rows_done'), total=Sum('rows_total'))
+    return {'total': sum(counts.values()),
+            'queued': counts.get(Job.QUEUED, 0),
+            'running': counts.get(Job.RUNNING, 0),
+            'done': counts.get(Job.DONE, 0),
+            'failed': counts.get(Job.FAILED, 0),
+            'rows_done': rows['done'] or 0,
+            'rows_total': rows['total'] or 0,
+            'errors': [{'recording': recording, 'slug': slug, 'error': error.strip().splitlines()[-1]}
+                       for recording, slug, error in jobs.filter(status=Job.FAILED)
+                       .values_list('recording_id', 'recording__slug', 'error') if error.strip()]}
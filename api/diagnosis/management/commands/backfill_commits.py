@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from diagnosis import plot_cache
+from diagnosis.models import CommitInfo, TestingRecording, NO_COMMIT_TITLE
+
+
+class Command(BaseCommand):
+    help = 'Fills commit titles and dates of recordings processed while GitHub was unavailable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repo-url', help='repository API url, GITHUB_REPO_URL by default')
+        parser.add_argument('--limit', type=int, help='max number of commits to fetch')
+
+    def handle(self, *args, **options):
+        missing = (TestingRecording.objects.exclude(commit_sha1='')
+                   .filter(Q(commit_date__isnull=True) | Q(title=NO_COMMIT_TITLE) | Q(title='')))
+        sha1s = list(missing.order_by().values_list('commit_sha1', flat=True).distinct()[:options['limit']])
+        fetched = updated = 0
+        for sha1 in sha1s:
+            info = CommitInfo.lookup(sha1, repo_url=options['repo_url'])
+            if info is None:
+                self.stderr.write(f"{sha1}: not found")
+                continue
+            fetched += 1
+            recordings = missing.filter(commit_sha1=sha1)
+            pks = list(recordings.values_list('pk', flat=True))
+            # Titles are drawn on plots
+            updated += recordings.update(title=info.message, commit_date=info.date, version=F('version') + 1)
+            for recording in TestingRecording.objects.filter(pk__in=pks):
+                plot_cache.invalidate(recording)
+        self.stdout.write(f"Commits: {len(sha1s)} missing, {fetched} fetched. Recordings updated: {updated}")
@@ -0,0 +1,38 @@
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from diagnosis.datadir import scenario_geometry
+from diagnosis.models import Scenario
+from diagnosis.pg_copy import update_frame
+
+
+class Command(BaseCommand):
+    help = 'Fills dists, vels, courses, num_targets, vel_our, min_dist and max_vel of scenarios ' \
+           'from their names, for sets loaded before the loader did it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--set', type=int, nargs='+', dest='sets', help='scenarios set ids, all sets by default')
+        parser.add_argument('--all', action='store_true', help='also refill scenarios that already have geometry')
+        parser.add_argument('--batch-size', type=int, default=50000, help='scenarios updated per transaction')
+
+    def handle(self, *args, **options):
+        scenarios = Scenario.objects.all()
+        if options['sets']:
+            scenarios = scenarios.filter(scenariosSet__in=options['sets'])
+        if not options['all']:
+            scenarios = scenarios.filter(dists=[])
+        last = 0
+        updated = 0
+        while True:
+            batch = list(scenarios.filter(pk__gt=last).order_by('pk')
+                         .values_list('pk', 'name')[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1][0]
+            pks, names = zip(*batch)
+            geometry = scenario_geometry(pd.Series(names)).assign(id=pks)
+            with transaction.atomic():
+                updated += update_frame(Scenario, geometry)
+            self.stdout.write(f"{updated} scenarios updated")
+        self.stdout.write(self.style.SUCCESS(f"Done, {updated} scenarios updated"))
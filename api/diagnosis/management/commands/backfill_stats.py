@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from diagnosis.models import RecordingStats, TestingRecording
+
+
+class Command(BaseCommand):
+    help = 'Computes RecordingStats of processed recordings ingested before they existed, ' \
+           'so trend and comparison include them'
+
+    def handle(self, *args, **options):
+        done = 0
+        missing = (TestingRecording.objects.filter(processed=True, stats__isnull=True)
+                   .only('pk', 'file', 'canonical').order_by('pk'))
+        for recording in missing:
+            field = recording.canonical or recording.file
+            if not field or not field.storage.exists(field.name):
+                self.stderr.write(f"Recording {recording.pk}: stats file is missing")
+                continue
+            try:
+                RecordingStats.update_for(recording)
+            except Exception as e:
+                # One unreadable file must not stop the backfill of the others
+                self.stderr.write(f"Recording {recording.pk}: {e}")
+                continue
+            done += 1
+        self.stdout.write(f"Stats computed: {done}")
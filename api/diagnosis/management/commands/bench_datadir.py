@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.datadir import parse_datadirs
+from diagnosis.synthetic import scenario_names
+
+
+def get_distance(foldername):
+    """
+    Per-row distance parser used by TestingRecording.to_dataframe before parse_datadirs
+    """
+
+    def get_n_targets(name):
+        foldername = os.path.split(name)[1]
+        foldername2 = foldername.split(sep="_")
+        if float(foldername2[1]) == 0 or float(foldername2[2]) == 0:
+            return 1
+        else:
+            return 2
+
+    foldername = os.path.split(foldername)[1]
+    n_targ = get_n_targets(foldername)
+    foldername2 = foldername.split(sep="_")
+    if n_targ == 1:
+        return max(float(foldername2[1]), float(foldername2[2]))
+    elif n_targ == 2:
+        return min(float(foldername2[1]), float(foldername2[2]))
+
+
+class Command(BaseCommand):
+    help = 'Compares vectorized scenario folder name parser with the per-row apply'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--targets', type=int, default=2)
+
+    def handle(self, *args, **options):
+        datadirs = '/data/scenarios/' + scenario_names(options['rows'], options['targets'])
+
+        started = time.perf_counter()
+        parsed = parse_datadirs(datadirs)
+        vectorized = time.perf_counter() - started
+        self.stdout.write(f"parse_datadirs: {vectorized:.2f} s ({len(datadirs) / vectorized:.0f} rows/s)")
+
+        if options['targets'] != 2:
+            return
+        started = time.perf_counter()
+        legacy = datadirs.apply(get_distance)
+        per_row = time.perf_counter() - started
+        self.stdout.write(f"apply(get_distance): {per_row:.2f} s ({len(datadirs) / per_row:.0f} rows/s)")
+        self.stdout.write(f"speedup: {per_row / vectorized:.1f}x, "
+                          f"distances match: {bool((legacy == parsed['dist']).all())}")
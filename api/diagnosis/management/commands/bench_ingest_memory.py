@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.synthetic import meta_frame, results_frame, write_frame
+
+
+class Rollback(Exception):
+    pass
+
+
+def memory_status(field):
+    """
+    Memory counter of current process from /proc in MB. Unlike ru_maxrss, VmHWM is not inherited from parent process
+    """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def reset_peak():
+    """
+    Resets VmHWM to current RSS, so the peak of scenarios set loading doesn't hide the peak of ingest
+    """
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def measure(meta_path, path, n_targets, chunk_bytes, conn):
+    """
+    Ingests stats file with create_sc_for_rec and sends seconds and peak RSS of the process in MB.
+    Database changes are rolled back
+    """
+    import django
+    django.setup()
+    from django.conf import settings
+    # With DEBUG every INSERT with its texts stays in connection.queries and memory grows with the file
+    settings.DEBUG = False
+    from django.core.files import File
+    from django.db import transaction
+    from diagnosis.models import ScenariosSet, TestingRecording, create_sc_for_rec
+
+    stored = []
+    try:
+        with transaction.atomic():
+            scenarios_set = ScenariosSet(processed=True)
+            with open(meta_path, 'rb') as f:
+                scenarios_set.metafile.save(os.path.basename(meta_path), File(f), save=False)
+            stored.append(scenarios_set.metafile)
+            scenarios_set.save()
+            scenarios_set.load_metafile()
+            recording = TestingRecording(title='memory benchmark', n_targets=n_targets, processed=True)
+            with open(path, 'rb') as f:
+                recording.file.save(os.path.basename(path), File(f), save=False)
+            stored.append(recording.file)
+            recording.save()
+
+            reset_peak()
+            baseline = memory_status('VmRSS')
+            started = time.perf_counter()
+            create_sc_for_rec(recording, chunk_bytes=chunk_bytes)
+            seconds = time.perf_counter() - started
+            stored.append(recording.canonical)
+            peak = memory_status('VmHWM')
+            raise Rollback
+    except Rollback:
+        pass
+    finally:
+        for file in stored:
+            if file:
+                file.storage.delete(file.name)
+    conn.send((seconds, peak - baseline, peak))
+
+
+class Command(BaseCommand):
+    help = 'Measures peak memory of recording ingest (create_sc_for_rec) for stats files of several sizes ' \
+           'against the configured database. Database changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 300000])
+        parser.add_argument('--targets', type=int, default=2)
+        parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--chunk-mb', type=float, nargs='+', default=[None],
+                            help='CSV megabytes per chunk, INGEST_CHUNK_BYTES by default')
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in options['rows']:
+                # Unique scenario names keep them unambiguous among scenarios already in the database
+                prefix = f'mem{uuid.uuid4().hex[:8]}sc'
+                meta_path = os.path.join(tmp, f'meta_{rows}.csv')
+                write_frame(meta_frame(rows, options['targets'], prefix=prefix), meta_path)
+                path = os.path.join(tmp, f'stats_{rows}.{options["format"]}')
+                # Parquet row groups play the role of CSV chunks
+                write_frame(results_frame(rows, options['targets'], prefix=prefix), path)
+                size = os.path.getsize(path) / 2 ** 20
+                for chunk_mb in options['chunk_mb']:
+                    chunk_bytes = int(chunk_mb * 2 ** 20) if chunk_mb else None
+                    parent, child = ctx.Pipe()
+                    p = ctx.Process(target=measure, args=(meta_path, path, options['targets'], chunk_bytes, child))
+                    p.start()
+                    # A failed child closes its end and recv raises EOFError instead of waiting forever
+                    child.close()
+                    seconds, growth, peak = parent.recv()
+                    p.join()
+                    chunk = f'{chunk_mb:g} MB' if chunk_mb else 'default'
+                    self.stdout.write(f"{rows:>9} rows {size:8.1f} MB file  chunk {chunk:>8}: {seconds:6.1f} s, "
+                                      f"peak RSS {peak:8.1f} MB (+{growth:.1f} MB over baseline)")
@@ -0,0 +1,108 @@
+import re
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from diagnosis.datadir import scenario_geometry
+from diagnosis.models import Scenario, ScenarioResult, ScenarioResultPayload, ScenariosSet, TestingRecording, \
+    LOOKUP_BATCH_SIZE, PAYLOAD_COLUMNS
+from diagnosis.pg_copy import copy_frame
+from diagnosis.synthetic import results_frame
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seeds synthetic scenarios and results in a rolled back transaction ' \
+           'and prints EXPLAIN ANALYZE of the hot ScenarioResult and Scenario queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', type=int, default=100000)
+        parser.add_argument('--recordings', type=int, default=10)
+        parser.add_argument('--lookup', type=int, default=LOOKUP_BATCH_SIZE, help='names per ingest lookup')
+        parser.add_argument('--text-size', type=int, default=1000, help='length of nav_report and command texts')
+        parser.add_argument('--verbose-plans', action='store_true', help='print whole plans, not only timings')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        n = options['scenarios']
+        frame = results_frame(n, text_size=options['text_size'])
+        names = frame['datadir'].str.rpartition('/')[2]
+
+        scenarios_set = ScenariosSet.objects.create(processed=True)
+        copy_frame(Scenario, scenario_geometry(names).assign(
+            name=names, scenariosSet=scenarios_set.pk, type=0, pelengs='{}'))
+        scenario_ids = list(scenarios_set.scenario_set.order_by('pk').values_list('pk', flat=True))
+
+        rng = np.random.default_rng(0)
+        recordings = []
+        results = frame.drop(columns=['datadir', *PAYLOAD_COLUMNS]).fillna('')
+        results['scenario'] = scenario_ids
+        payloads = frame[list(PAYLOAD_COLUMNS)].fillna('')
+        for i in range(options['recordings']):
+            recording = TestingRecording.objects.create(title=f'bench {i}', processed=True, sc_set=scenarios_set)
+            results['pack'] = recording.pk
+            results['code'] = rng.choice(6, n, p=[0.6, 0.15, 0.15, 0.02, 0.03, 0.05])
+            copy_frame(ScenarioResult, results)
+            payloads['pack'] = recording.pk
+            payloads['result'] = list(recording.scenarioresult_set.order_by('pk').values_list('pk', flat=True))
+            copy_frame(ScenarioResultPayload, payloads)
+            recordings.append(recording)
+        with connection.cursor() as cursor:
+            # Results as they were stored with texts inline, for comparison of aggregate scans
+            cursor.execute('CREATE TEMPORARY TABLE bench_inline_results AS '
+                           'SELECT r.*, p.nav_report, p.command FROM diagnosis_scenarioresult r '
+                           'LEFT JOIN diagnosis_scenarioresultpayload p ON p.result_id = r.id')
+            cursor.execute('ANALYZE diagnosis_scenario, diagnosis_scenarioresult, bench_inline_results')
+        self.stdout.write(f"Seeded {n} scenarios and {n * len(recordings)} results")
+
+        lookup = names.sample(min(options['lookup'], n), random_state=0).tolist()
+        self.explain('ingest lookup (resolve_scenarios batch)', options,
+                     Scenario.objects.filter(name__in=lookup).values_list('name', 'pk', 'scenariosSet_id'))
+        self.explain('per-recording aggregate', options,
+                     ScenarioResult.objects.filter(pack=recordings[-1]).values('code').annotate(n=Count('id')))
+        with connection.cursor() as cursor:
+            # Temporary tables are never scanned in parallel, both scans run in one process
+            cursor.execute('SET LOCAL max_parallel_workers_per_gather = 0')
+        for title, table in (('aggregate scan, texts inline (before)', 'bench_inline_results'),
+                             ('aggregate scan, texts in payload table', ScenarioResult._meta.db_table)):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT pg_size_pretty(pg_table_size('{table}'))")
+                size = cursor.fetchone()[0]
+            self.explain_sql(f'{title}, {size}', options,
+                             f'SELECT pack_id, code, count(*), avg(dist1) FROM {table} GROUP BY pack_id, code')
+        with connection.cursor() as cursor:
+            cursor.execute('RESET max_parallel_workers_per_gather')
+        self.explain('success rate by geometry (min_dist < 2, max_vel > 15)', options,
+                     ScenarioResult.objects.filter(pack=recordings[-1], scenario__min_dist__lt=2,
+                                                   scenario__max_vel__gt=15).values('code').annotate(n=Count('id')))
+        self.explain('per-scenario history', options,
+                     ScenarioResult.objects.filter(scenario_id=scenario_ids[n // 2])
+                     .order_by('pack').values_list('pack', 'code', 'exec_time'))
+
+    def explain(self, title, options, queryset):
+        self.print_plan(title, options, queryset.explain(analyze=True, buffers=True))
+
+    def explain_sql(self, title, options, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql)
+            self.print_plan(title, options, '\n'.join(row[0] for row in cursor.fetchall()))
+
+    def print_plan(self, title, options, plan):
+        timings = ', '.join(re.findall(r'(?:Planning|Execution) Time: [\d.]+ ms', plan))
+        self.stdout.write(self.style.MIGRATE_HEADING(title) + f": {timings}")
+        if options['verbose_plans']:
+            self.stdout.write(plan)
+        else:
+            self.stdout.writelines(line.strip() for line in plan.splitlines() if 'Scan' in line)
@@ -0,0 +1,142 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from diagnosis import file_cache, plot_cache
+from diagnosis.models import ScenariosSet, TestingRecording, create_sc_for_rec
+from diagnosis.synthetic import meta_frame, results_frame, write_frame
+
+
+class Rollback(Exception):
+    pass
+
+
+def timed(func, repeat=1):
+    """
+    Calls func repeat times
+    @return: best time in seconds and result of the last call
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.getenv('GIT_COMMIT')
+
+
+class Command(BaseCommand):
+    help = 'Times ingest, pivot, plot and compare on synthetic recordings against the configured database ' \
+           'and appends results to a JSON file. Database changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--targets', type=int, nargs='+', default=[1, 2])
+        parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], nargs='+', default=['csv'])
+        parser.add_argument('--repeat', type=int, default=3, help='runs of read-only stages, the best one counts')
+        parser.add_argument('--output', default='benchmark.json', help='JSON file, runs are appended to it')
+
+    def handle(self, *args, **options):
+        run = {
+            'started': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'cases': [],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in options['rows']:
+                for n_targets in options['targets']:
+                    # Unique scenario names keep them unambiguous among scenarios already in the database
+                    prefix = f'bench{uuid.uuid4().hex[:8]}sc'
+                    meta_path = os.path.join(tmp, f'meta_{rows}_{n_targets}t.csv')
+                    write_frame(meta_frame(rows, n_targets, prefix=prefix), meta_path)
+                    for file_format in options['format']:
+                        case = self.run_case(tmp, meta_path, prefix, rows, n_targets, file_format,
+                                             options['repeat'])
+                        run['cases'].append(case)
+                        self.stdout.write(f"{rows:>9} rows {n_targets}t {file_format:>7}: " +
+                                          ', '.join(f'{stage} {seconds:.3f}s'
+                                                    for stage, seconds in case['stages'].items()))
+
+        runs = []
+        if os.path.exists(options['output']):
+            with open(options['output']) as f:
+                runs = json.load(f)
+        runs.append(run)
+        with open(options['output'], 'w') as f:
+            json.dump(runs, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results appended to {options['output']}"))
+
+    def run_case(self, tmp, meta_path, prefix, rows, n_targets, file_format, repeat):
+        # Two recordings of the same scenarios with shuffled codes for compare
+        results = results_frame(rows, n_targets, prefix=prefix)
+        paths = []
+        for i in range(2):
+            path = os.path.join(tmp, f'results_{rows}_{n_targets}t_{i}.{file_format}')
+            write_frame(results, path)
+            paths.append(path)
+            results['code'] = np.random.default_rng(i).permutation(results['code'].values)
+
+        case = {'rows': rows, 'targets': n_targets, 'format': file_format,
+                'file_mb': round(os.path.getsize(paths[0]) / 2 ** 20, 2), 'stages': {}}
+        stages = case['stages']
+        stored = []
+        try:
+            with transaction.atomic():
+                scenarios_set = ScenariosSet(processed=True)
+                with open(meta_path, 'rb') as f:
+                    scenarios_set.metafile.save(os.path.basename(meta_path), File(f), save=False)
+                stored.append(scenarios_set.metafile)
+                scenarios_set.save()
+                stages['load_metafile'], _ = timed(scenarios_set.load_metafile)
+
+                recordings = []
+                for i, path in enumerate(paths):
+                    recording = TestingRecording(title=f'benchmark {i}', n_targets=n_targets, processed=True)
+                    with open(path, 'rb') as f:
+                        recording.file.save(os.path.basename(path), File(f), save=False)
+                    stored.append(recording.file)
+                    recording.save()
+                    seconds, (inserted, skipped) = timed(lambda: create_sc_for_rec(recording))
+                    stored.append(recording.canonical)
+                    recordings.append(recording)
+                stages['create_sc_for_rec'] = seconds
+                case['inserted'], case['skipped'] = inserted, skipped
+                recording, previous = recordings[1], recordings[0]
+
+                stages['to_dataframe'], _ = timed(recording.to_dataframe, repeat)
+                # Counted in SQL, cold and warm runs differ only by database buffer cache
+                stages['pivot_scenario_types_cold'], _ = timed(recording.pivot_scenario_types)
+                stages['pivot_scenario_types'], _ = timed(recording.pivot_scenario_types, repeat)
+                for graph_type in plot_cache.GRAPH_TYPES:
+                    stages[f'plot_{graph_type}'], _ = timed(
+                        lambda: plot_cache.render(recording, graph_type, plot_cache.DEFAULT_SIZE), repeat)
+                stages['compare'], _ = timed(lambda: recording.compare(previous), repeat)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            for field in stored:
+                if field.name and os.path.exists(field.path):
+                    file_cache.drop_cached(field.path)
+                field.delete(save=False)
+        return case
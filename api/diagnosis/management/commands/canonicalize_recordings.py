@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from diagnosis import file_cache
+from diagnosis.models import TestingRecording, INGEST_CHUNK_BYTES, canonical_name
+
+
+class Command(BaseCommand):
+    help = 'Writes canonical Parquet files of recordings ingested before they existed, without re-ingest'
+
+    def handle(self, *args, **options):
+        done = 0
+        recordings = TestingRecording.objects.filter(canonical='').exclude(file='').only('pk', 'file', 'content_sha256')
+        for recording in recordings:
+            if not recording.file.storage.exists(recording.file.name):
+                self.stderr.write(f"Recording {recording.pk}: {recording.file.name} is missing")
+                continue
+            recording.canonical.name = canonical_name(recording)
+            with file_cache.CanonicalWriter(recording.canonical.path) as canonical:
+                for chunk in file_cache.iter_stats_file(recording.file.path, INGEST_CHUNK_BYTES):
+                    canonical.write(chunk)
+            TestingRecording.objects.filter(pk=recording.pk).update(canonical=recording.canonical.name)
+            # Its parsed copy in the file cache isn't read anymore
+            file_cache.drop_cached(recording.file.path, recording.content_sha256)
+            done += 1
+        self.stdout.write(f"Canonical files written: {done}")
@@ -0,0 +1,31 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from diagnosis.synthetic import meta_frame, results_frame, write_frame
+
+
+class Command(BaseCommand):
+    help = 'Writes synthetic recording stats files and matching scenarios set metafiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('out', help='output directory')
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000])
+        parser.add_argument('--targets', type=int, nargs='+', default=[1, 2])
+        parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], nargs='+', default=['csv'])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--text-size', type=int, default=1000, help='length of nav_report and command texts')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['out'], exist_ok=True)
+        for rows in options['rows']:
+            for n_targets in options['targets']:
+                name = f'{rows}_{n_targets}t'
+                meta_path = os.path.join(options['out'], f'meta_{name}.csv')
+                write_frame(meta_frame(rows, n_targets, options['seed']), meta_path)
+                self.stdout.write(meta_path)
+                results = results_frame(rows, n_targets, options['seed'], options['text_size'])
+                for file_format in options['format']:
+                    path = os.path.join(options['out'], f'results_{name}.{file_format}')
+                    write_frame(results, path)
+                    self.stdout.write(path)
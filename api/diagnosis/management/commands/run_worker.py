@@ -0,0 +1,75 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from diagnosis.jobs import claim_job, run_job, Interrupted
+
+logger = logging.getLogger(__name__)
+
+
+def interrupt(signum, frame):
+    # Only the first signal interrupts, requeueing of the job must not be interrupted again
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise Interrupted
+
+
+def work(poll_interval, once):
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        loop(poll_interval, once)
+    except Interrupted:
+        logger.info("Worker stopped")
+
+
+def loop(poll_interval, once):
+    while True:
+        # Connections broken by a database restart are dropped and reopened
+        close_old_connections()
+        try:
+            job = claim_job()
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            run_job(job)
+        except Exception:
+            # Database errors outside of job handlers must not kill the worker,
+            # a job left running stops getting heartbeats and is claimed again after STALE_AFTER
+            logger.exception("Worker iteration failed")
+            connections.close_all()
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs: recording ingest and scenarios set loading'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', 2)),
+                            help='Number of jobs executed in parallel')
+        parser.add_argument('--poll-interval', type=float, default=2,
+                            help='Seconds to wait when queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when queue is empty')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+        # Every worker process opens its own connection
+        connections.close_all()
+        processes = [multiprocessing.Process(target=work, args=(options['poll_interval'], options['once']),
+                                             name=f'worker-{i}')
+                     for i in range(options['concurrency'])]
+        for p in processes:
+            p.start()
+        # docker stop sends SIGTERM, workers put their jobs back to queue and exit
+        signal.signal(signal.SIGTERM, lambda signum, frame: [p.terminate() for p in processes])
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            for p in processes:
+                p.terminate()
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def mark_sets_processed(apps, schema_editor):
+    # Sets loaded before the job queue are complete already
+    ScenariosSet = apps.get_model('diagnosis', 'ScenariosSet')
+    ScenariosSet.objects.update(processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0021_auto_20211126_1654'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenariosset',
+            name='processed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_sets_processed, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.TextField(max_length=100)),
+                ('status', models.IntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Done'), (3, 'Failed')], default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=5)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(blank=True, default=None, null=True)),
+                ('finished', models.DateTimeField(blank=True, default=None, null=True)),
+                ('duration', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('recording', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='diagnosis.testingrecording')),
+                ('scenarios_set', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='diagnosis.scenariosset')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:31
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0022_auto_20261018_1530'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordingStats',
+            fields=[
+                ('recording', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='diagnosis.testingrecording')),
+                ('dists', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), default=list, size=None)),
+                ('codes', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('counts', django.contrib.postgres.fields.ArrayField(base_field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None), default=list, size=None)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0023_recordingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testingrecording',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+def fill_build_number_int(apps, schema_editor):
+    TestingRecording = apps.get_model('diagnosis', 'TestingRecording')
+    for pk, build_number in TestingRecording.objects.values_list('pk', 'build_number'):
+        if build_number.isdigit() and len(build_number) < 10:
+            TestingRecording.objects.filter(pk=pk).update(build_number_int=int(build_number))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0024_testingrecording_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testingrecording',
+            name='build_number_int',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(fill_build_number_int, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='testingrecording',
+            index=models.Index(condition=models.Q(('processed', True)), fields=['-id'], name='rec_processed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testingrecording',
+            index=models.Index(condition=models.Q(('processed', True)), fields=['n_targets', '-id'], name='rec_processed_n_targets_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testingrecording',
+            index=models.Index(condition=models.Q(('processed', True)), fields=['build_number_int'], name='rec_processed_build_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testingrecording',
+            index=models.Index(condition=models.Q(('processed', True)), fields=['date'], name='rec_processed_date_idx'),
+        ),
+    ]
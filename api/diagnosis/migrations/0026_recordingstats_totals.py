@@ -0,0 +1,27 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:51
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    RecordingStats = apps.get_model('diagnosis', 'RecordingStats')
+    for stats in RecordingStats.objects.all().iterator():
+        stats.totals = [sum(column) for column in zip(*stats.counts)] if stats.counts else [0] * len(stats.codes)
+        stats.save(update_fields=['totals'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0025_auto_20261018_1550'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordingstats',
+            name='totals',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+# Keeps the first of scenarios sharing set and name, results of the others are moved to it
+MERGE_DUPLICATE_SCENARIOS = '''
+WITH duplicates AS (
+    SELECT id, min(id) OVER (PARTITION BY "scenariosSet_id", name) AS keep_id
+    FROM diagnosis_scenario
+)
+UPDATE diagnosis_scenarioresult r SET scenario_id = d.keep_id
+FROM duplicates d WHERE r.scenario_id = d.id AND d.id <> d.keep_id;
+
+DELETE FROM diagnosis_scenario s
+USING diagnosis_scenario k
+WHERE s."scenariosSet_id" = k."scenariosSet_id" AND s.name = k.name AND s.id > k.id;
+
+-- Check deferred foreign keys now, Postgres refuses to alter a table with pending trigger events
+SET CONSTRAINTS ALL IMMEDIATE;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0026_recordingstats_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scenario',
+            index=models.Index(fields=['name'], name='scenario_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scenarioresult',
+            index=models.Index(fields=['pack', 'code'], name='result_pack_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scenarioresult',
+            index=models.Index(fields=['scenario', 'pack'], name='result_scenario_pack_idx'),
+        ),
+        migrations.RunSQL(MERGE_DUPLICATE_SCENARIOS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='scenario',
+            constraint=models.UniqueConstraint(fields=('scenariosSet', 'name'), name='scenario_set_name_uniq'),
+        ),
+    ]
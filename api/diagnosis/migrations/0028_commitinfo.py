@@ -0,0 +1,22 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0027_scenario_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommitInfo',
+            fields=[
+                ('sha1', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('message', models.TextField(default='')),
+                ('date', models.DateTimeField(blank=True, default=None, null=True)),
+                ('fetched', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0028_commitinfo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='rows_done',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='rows_total',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='stage',
+            field=models.TextField(blank=True, choices=[('commit', 'Fetching commit'), ('ingest', 'Loading results'), ('plots', 'Rendering plots')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='updated',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:13
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def hash_existing_files(apps, schema_editor):
+    """
+    Hashes stats files of existing recordings, later copies of a file become duplicates of the first one
+    """
+    TestingRecording = apps.get_model('diagnosis', 'TestingRecording')
+    first = {}
+    for recording in TestingRecording.objects.exclude(file='').order_by('pk').only('pk', 'file'):
+        if not recording.file.storage.exists(recording.file.name):
+            continue
+        digest = hashlib.sha256()
+        with recording.file.open('rb') as f:
+            for chunk in f.chunks():
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        TestingRecording.objects.filter(pk=recording.pk).update(content_sha256=digest,
+                                                                duplicate_of=first.get(digest))
+        first.setdefault(digest, recording.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0029_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testingrecording',
+            name='content_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='testingrecording',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='diagnosis.testingrecording'),
+        ),
+        migrations.RunPython(hash_existing_files, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='testingrecording',
+            constraint=models.UniqueConstraint(condition=models.Q(('duplicate_of', None), models.Q(('content_sha256', ''), _negated=True)), fields=('content_sha256',), name='rec_content_sha256_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0030_content_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testingrecording',
+            name='canonical',
+            field=models.FileField(blank=True, default='', upload_to='canonical/'),
+        ),
+    ]
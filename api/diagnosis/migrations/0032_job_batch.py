@@ -0,0 +1,22 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0031_testingrecording_canonical'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='batch',
+            field=models.UUIDField(blank=True, default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('batch__isnull', False)), fields=['batch'], name='job_batch_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0032_job_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScenarioResultPayload',
+            fields=[
+                ('result', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='payload', serialize=False, to='diagnosis.scenarioresult')),
+                ('nav_report', models.TextField(default='', max_length=3000)),
+                ('command', models.TextField(default='', max_length=3000)),
+                ('pack', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='diagnosis.testingrecording')),
+            ],
+        ),
+        # Payloads go with their results however results are deleted, Django deletes results with plain DELETE
+        migrations.RunSQL(
+            'ALTER TABLE diagnosis_scenarioresultpayload ADD CONSTRAINT scenarioresultpayload_result_fk '
+            'FOREIGN KEY (result_id) REFERENCES diagnosis_scenarioresult (id) ON DELETE CASCADE',
+            'ALTER TABLE diagnosis_scenarioresultpayload DROP CONSTRAINT scenarioresultpayload_result_fk',
+        ),
+    ]
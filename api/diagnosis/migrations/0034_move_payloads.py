@@ -0,0 +1,58 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:22
+
+from django.db import migrations, transaction
+
+# Results moved per transaction
+BATCH_SIZE = 50000
+
+
+def _id_ranges(cursor, table, column='id'):
+    cursor.execute(f'SELECT min({column}), max({column}) FROM {table}')
+    low, high = cursor.fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE - 1
+
+
+def move_payloads(apps, schema_editor):
+    """
+    Copies non-empty texts of results into payload table, one committed transaction per BATCH_SIZE ids.
+    Rows copied by an interrupted run are skipped when migration is run again
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for start, stop in _id_ranges(cursor, 'diagnosis_scenarioresult'):
+            with transaction.atomic(using=connection.alias):
+                cursor.execute('''
+                    INSERT INTO diagnosis_scenarioresultpayload (result_id, pack_id, nav_report, command)
+                    SELECT id, pack_id, nav_report, command FROM diagnosis_scenarioresult
+                    WHERE id BETWEEN %s AND %s AND (nav_report <> '' OR command <> '')
+                    ON CONFLICT (result_id) DO NOTHING''', [start, stop])
+
+
+def restore_payloads(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for start, stop in _id_ranges(cursor, 'diagnosis_scenarioresultpayload', 'result_id'):
+            with transaction.atomic(using=connection.alias):
+                cursor.execute('''
+                    UPDATE diagnosis_scenarioresult r SET nav_report = p.nav_report, command = p.command
+                    FROM diagnosis_scenarioresultpayload p
+                    WHERE p.result_id = r.id AND p.result_id BETWEEN %s AND %s''', [start, stop])
+
+
+class Migration(migrations.Migration):
+    """
+    Only the copy is non-atomic, so a failed run leaves nothing but copied rows behind and can be repeated
+    """
+    # Batches are committed one by one
+    atomic = False
+
+    dependencies = [
+        ('diagnosis', '0033_scenarioresultpayload'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_payloads, restore_payloads),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Dropped columns keep their space until the table is rewritten:
+    run VACUUM FULL diagnosis_scenarioresult (or pg_repack) afterwards
+    """
+
+    dependencies = [
+        ('diagnosis', '0034_move_payloads'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='scenarioresult',
+            name='command',
+        ),
+        migrations.RemoveField(
+            model_name='scenarioresult',
+            name='nav_report',
+        ),
+    ]
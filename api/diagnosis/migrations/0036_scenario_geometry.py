@@ -0,0 +1,40 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:27
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0035_remove_scenarioresult_texts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scenario',
+            name='max_vel',
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='scenario',
+            name='min_dist',
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='scenario',
+            index=models.Index(fields=['min_dist', 'max_vel'], name='scenario_min_dist_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scenario',
+            index=models.Index(fields=['max_vel'], name='scenario_max_vel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scenario',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['dists'], name='scenario_dists_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='scenario',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vels'], name='scenario_vels_gin'),
+        ),
+    ]
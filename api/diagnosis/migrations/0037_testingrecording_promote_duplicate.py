@@ -0,0 +1,19 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagnosis', '0036_scenario_geometry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testingrecording',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='duplicates', to='diagnosis.testingrecording'),
+        ),
+    ]
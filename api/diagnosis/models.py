@@ -1,111 +1,201 @@
+import contextlib
+import logging
 import os
+import time
 import uuid
 
 import iso8601
 import pandas as pd
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction, connection, connections, DEFAULT_DB_ALIAS, InterfaceError, \
+    OperationalError
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.text import slugify
 
+from . import file_cache, plot_cache, timing
 from .build_graphs import plot_graph_normal, plot_minister_mode
-from .decorators import postpone
+from .datadir import parse_datadirs, scenario_geometry, scenario_names
 from .gitgub_utils import get_commit
+from .pg_copy import copy_frame, estimated_rows, indexes_dropped
+
+logger = logging.getLogger(__name__)
+
+# CSV bytes read per chunk during ingest. With 1 KB texts 8 MB is about 4000 rows
+INGEST_CHUNK_BYTES = 8 * 1024 * 1024
+# Rows per INSERT statement during ingest
+INGEST_BATCH_SIZE = 5000
+# Scenario names per lookup query during ingest, larger batches make planner skip scenario_name_idx
+LOOKUP_BATCH_SIZE = 5000
+# Scenarios sets of this many new scenarios, larger than the whole table, are loaded without Scenario indexes
+BULK_LOAD_MIN_ROWS = 100000
+# ScenarioResult fields filled from the stats file columns of the same name
+RESULT_COLUMNS = ('code', 'exec_time', 'dist1', 'dist2', 'course1', 'course2',
+                  'peleng1', 'peleng2', 'type1', 'type2')
+# Stats file columns stored in ScenarioResultPayload
+PAYLOAD_COLUMNS = ('nav_report', 'command')
+
+
+class CommitInfo(models.Model):
+    """
+    Commit metadata fetched from GitHub, commits never change so it is fetched once per sha1
+    """
+    sha1 = models.CharField(max_length=40, primary_key=True)
+    message = models.TextField(default='')
+    date = models.DateTimeField(default=None, null=True, blank=True)
+    fetched = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def lookup(cls, sha1, repo_url=None):
+        """
+        Gets commit metadata from the table or from GitHub
+        @param repo_url: repository API url, GITHUB_REPO_URL by default
+        @return: CommitInfo or None if GitHub is unavailable or has no such commit
+        """
+        info = cls.objects.filter(sha1=sha1).first()
+        if info is not None:
+            return info
+        commit = get_commit(repo_url=repo_url or os.getenv('GITHUB_REPO_URL'), commit_sha1=sha1,
+                            token=os.getenv('GITHUB_TOKEN'))
+        if commit is None:
+            return None
+        info, _ = cls.objects.get_or_create(sha1=sha1, defaults={
+            'message': commit['commit']['message'],
+            'date': iso8601.parse_date(commit['commit']['author']['date']),
+        })
+        return info
+
+
+# Result counts per scenario type of any target and code of one pack, served by result_pack_code_idx.
+# Empty and unparsed types are skipped like NaN types of stats files
+PIVOT_SQL = '''
+SELECT t.type, code, count(*)
+FROM {results}, unnest(ARRAY[type1, type2]) AS t(type)
+WHERE pack_id = %s AND t.type NOT IN ('', 'nan')
+GROUP BY 1, 2
+'''
+
+# Title of recordings whose commit couldn't be fetched
+NO_COMMIT_TITLE = "Couldn't retrieve commit message"
 
 
 class TestingRecording(models.Model):
     date = models.DateTimeField(default=timezone.now)
     file = models.FileField(upload_to='')
+    # Typed Parquet copy of file written at ingest, analytics read it instead of the upload
+    canonical = models.FileField(upload_to='canonical/', blank=True, default='')
     title = models.TextField(default="", max_length=1000)
     commit_sha1 = models.TextField(default="", max_length=40)
     commit_date = models.DateTimeField(default=None, null=True, blank=True)
     build_number = models.TextField(default="", max_length=20)
+    # build_number as integer for range filters, None for non-numeric build numbers
+    build_number_int = models.IntegerField(default=None, null=True, blank=True)
     n_targets = models.IntegerField(default=1)
     processed = models.BooleanField(default=False)
     slug = models.SlugField(max_length=200, unique=True, default='')
     n_scenarios = models.IntegerField(default=0)
     sc_set = models.ForeignKey("ScenariosSet", on_delete=models.CASCADE, blank=True, null=True)
+    # Incremented on every processing, identifies derived data such as cached plots
+    version = models.IntegerField(default=0)
+    # SHA-256 of stats file, identical uploads are found by it
+    content_sha256 = models.CharField(max_length=64, default='', blank=True)
+    # Set for recordings uploaded again with the force duplicate policy.
+    # Deleting the original promotes one of its duplicates, see promote_duplicate
+    duplicate_of = models.ForeignKey('self', on_delete=models.DO_NOTHING, blank=True, null=True,
+                                     related_name='duplicates')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_sha256'], name='rec_content_sha256_uniq',
+                                    condition=models.Q(duplicate_of=None) & ~models.Q(content_sha256='')),
+        ]
+        indexes = [
+            # Main page listing and its filters, newest first
+            models.Index(fields=['-id'], name='rec_processed_id_idx', condition=models.Q(processed=True)),
+            models.Index(fields=['n_targets', '-id'], name='rec_processed_n_targets_idx',
+                         condition=models.Q(processed=True)),
+            models.Index(fields=['build_number_int'], name='rec_processed_build_idx',
+                         condition=models.Q(processed=True)),
+            models.Index(fields=['date'], name='rec_processed_date_idx', condition=models.Q(processed=True)),
+        ]
 
     def save(self, *args, **kwargs):
-        self.slug = slugify(self.title + ' ' + str(self.date) + str(self.n_targets) + uuid.uuid4().hex[:6].upper())
+        self.build_number_int = (int(self.build_number)
+                                 if self.build_number.isdigit() and len(self.build_number) < 10 else None)
+        # Slug is kept on reprocessing, links to the recording stay valid
+        if not self.slug:
+            self.slug = slugify(self.title + ' ' + str(self.date) + str(self.n_targets) + uuid.uuid4().hex[:6].upper())
         super().save(*args, **kwargs)
         if not self.processed:
+            Job.enqueue(PROCESS_RECORDING, recording=self)
+
+    def process(self, progress=None):
+        """
+        Fetches commit info and loads scenario results from stats file. Runs in background worker
+        @param progress: callback progress(stage, rows_done, rows_total), e.g. Job.report
+        """
+        progress = progress or (lambda *args: None)
+        # Commit metadata is fetched once, reprocessing doesn't go to GitHub again
+        if self.commit_date is None:
+            progress(FETCH_COMMIT)
             self.process_sha1()
-            create_sc_for_rec(self)
-            self.processed = True
-            self.save()
+        progress(INGEST, 0)
+        create_sc_for_rec(self, progress=progress)
+        self.processed = True
+        self.version += 1
+        self.save()
+        progress(RENDER_PLOTS, self.n_scenarios, self.n_scenarios)
+        plot_cache.invalidate(self)
+        plot_cache.prerender(self)
 
     def process_sha1(self):
         if self.commit_sha1:
-            commit = get_commit(repo_url=os.getenv('GITHUB_REPO_URL'), commit_sha1=self.commit_sha1,
-                                token=os.getenv('GITHUB_TOKEN'))
-            if commit is not None:
-                self.title = commit['commit']['message']
-                self.commit_date = iso8601.parse_date(commit['commit']['author']['date'])
+            info = CommitInfo.lookup(self.commit_sha1)
+            if info is not None:
+                self.title = info.message
+                self.commit_date = info.date
             else:
-                self.title = "Couldn't retrieve commit message"
+                self.title = NO_COMMIT_TITLE
 
+    @timing.span('pivot')
     def pivot_scenario_types(self):
         """
-        Calculates pivot table for code percentage per scenario type
-        @rtype: pd.DataFrame
+        Calculates pivot table for code percentage per scenario type.
+        Counted in SQL from ScenarioResult. Like the distance chart it counts every row of the stats file,
+        so recordings with rows of unknown scenarios, which have no ScenarioResult, are counted from the file
+        @return: pd.DataFrame with types as index and codes as columns, None if there are no results and no file
         """
+        with connection.cursor() as cursor:
+            cursor.execute(PIVOT_SQL.format(results=ScenarioResult._meta.db_table), [self.pk])
+            rows = cursor.fetchall()
+        if rows and ScenarioResult.objects.filter(pack_id=self.pk).count() == self.n_scenarios:
+            p = pd.DataFrame(rows, columns=['type', 'code', 'count']).pivot_table(
+                values='count', index='type', columns='code', aggfunc='sum', fill_value=0)
+            return p.divide(p.sum(axis=1), axis=0) * 100
         df = load_df_from_rec(self)
         if df is not None:
-            a = df.melt(id_vars=df.columns[:-2], value_name="type").dropna(subset=["type"]).drop(columns=["variable"])
+            a = df.melt(id_vars=['datadir', 'code'], value_vars=['type1', 'type2'],
+                        value_name="type").dropna(subset=["type"]).drop(columns=["variable"])
             p = pd.pivot_table(a, values='datadir', index=['type'], columns=['code'], aggfunc='count', fill_value=0)
             p_sum = p.sum(axis=1)
             return p.divide(p_sum, axis=0) * 100
         else:
             return None
 
+    @timing.span('to_dataframe')
     def to_dataframe(self):
         """
-        Builds percent diagram with codes and errors to velocities graph
+        Builds percent diagram with codes and errors to velocities graph.
+        Served from RecordingStats, recordings ingested before it existed get their stats computed on first access
         @return: pd.Dataframe
         """
-        filename = self.file.path
-
         try:
-            file_extension = filename.split('.')[-1]
-            if file_extension == 'parquet':
-                df = pd.read_parquet(filename, engine='fastparquet')
-            elif file_extension == 'xlsx':
-                df = pd.read_excel(filename, engine='openpyxl')
-            else:
-                df = pd.read_csv(filename.path)
-        except ValueError:
-            df = pd.read_csv(filename.path)
-
-        def get_distance(foldername):
-            def get_n_targets(name):
-                """
-                Detects number of targets in case
-                @param name: foldername with path
-                @return:
-                """
-                foldername = os.path.split(name)[1]
-                foldername2 = foldername.split(sep="_")
-                if float(foldername2[1]) == 0 or float(foldername2[2]) == 0:
-                    return 1
-                else:
-                    return 2
-
-            foldername = os.path.split(foldername)[1]
-            n_targ = get_n_targets(foldername)
-            foldername2 = foldername.split(sep="_")
-            if n_targ == 1:
-                return max(float(foldername2[1]), float(foldername2[2]))
-            elif n_targ == 2:
-                return min(float(foldername2[1]), float(foldername2[2]))
-
-        df['dist'] = df['datadir'].apply(get_distance)
-        n_targ = 2 if len(df.query('dist1!=0 & dist2 != 0')) else 1
-        a = pd.pivot_table(df, values='datadir', index=['dist'], columns=['code'], aggfunc='count', fill_value=0)
-        asum = a.sum(axis=1)
-        a = a.divide(asum, axis=0) * 100
-        # a = a.set_index('dist')
-        return a
+            stats = self.stats
+        except RecordingStats.DoesNotExist:
+            stats = RecordingStats.update_for(self)
+        return stats.to_dataframe()
 
     def compare(self, previous):
         """
@@ -122,78 +212,191 @@ class TestingRecording(models.Model):
 
         return result
 
-    def gen_plot(self, graph_type='normal'):
+    @timing.span('plot')
+    def gen_plot(self, graph_type='normal', dpi=200):
         """
         Строит график по статистике записи тестирования
         @param graph_type: Тип графика: 'normal' или 'minister'
+        @param dpi: Разрешение, 200 соответствует 2000x1200
         @return: График
         """
         if graph_type == 'minister':
             return plot_minister_mode(self.to_dataframe(),
-                                      title=f"Дата`{self.date}`. Целей: {self.n_targets}")
+                                      title=f"Дата`{self.date}`. Целей: {self.n_targets}", dpi=dpi)
         else:
             return plot_graph_normal(self.to_dataframe(),
-                                     title=f"`{self.title}`. Целей: {self.n_targets}")
+                                     title=f"`{self.title}`. Целей: {self.n_targets}", dpi=dpi)
+
+    @property
+    def data_path(self):
+        """
+        Path of stats file for analytics: canonical Parquet, or the upload for recordings ingested before it existed
+        """
+        return self.canonical.path if self.canonical else self.file.path
 
     def __str__(self):
         return self.title + '_' + str(self.date)
 
 
+@receiver(pre_delete, sender=TestingRecording)
+def promote_duplicate(sender, instance, **kwargs):
+    """
+    Makes the oldest duplicate of deleted recording the original and re-points the other duplicates to it.
+    Setting all of them to NULL would leave several originals of one content_sha256
+    """
+    duplicates = list(TestingRecording.objects.filter(duplicate_of=instance).order_by('pk')
+                      .values_list('pk', flat=True))
+    if not duplicates:
+        return
+    # The deleted row leaves the unique constraint before the promoted one enters it
+    TestingRecording.objects.filter(pk=instance.pk).update(content_sha256='')
+    TestingRecording.objects.filter(pk__in=duplicates[1:]).update(duplicate_of=duplicates[0])
+    TestingRecording.objects.filter(pk=duplicates[0]).update(duplicate_of=None)
+
+
+def canonical_name(recording):
+    return f'canonical/{recording.pk}.parquet'
+
+
+@timing.span('load_frame')
 def load_df_from_rec(recording):
     """
-    Loads pandas df from recording stats file
+    Loads pandas df from recording stats file through the parsed file cache
     @param recording:
     @return:
     """
+    if not recording.canonical and not recording.file:
+        return None
     try:
-        try:
-            file_extension = recording.file.path.split('.')[-1]
-            if file_extension == 'parquet':
-                df = pd.read_parquet(recording.file.path)
-            elif file_extension == 'xlsx':
-                df = pd.read_excel(recording.file.path, engine='openpyxl')
-            else:
-                df = pd.read_csv(recording.file.path)
-        except ValueError:
-            df = pd.read_csv(recording.file.path)
-
-        return df
+        return file_cache.load_frame(recording.data_path)
     except FileNotFoundError:
         return None
 
 
-@postpone
-def create_sc_for_rec(recording):
-    df = load_df_from_rec(recording)
-
-    i = 0
-    for index, row in df.iterrows():
-        i += 1
-        try:
-            scenario = Scenario.objects.get(name=os.path.split(row['datadir'])[1])
-            obj = ScenarioResult()
-            obj.scenario = scenario
-            if i < 3:
-                recording.sc_set = scenario.scenariosSet
-                recording.save()
-            obj.pack = recording
-            obj.code = row['code']
-            obj.exec_time = row['exec_time']
-            obj.nav_report = row['nav_report']
-            obj.command = row['command']
-            obj.dist1 = row['dist1']
-            obj.dist2 = row['dist2']
-            obj.course1 = row['course1']
-            obj.course2 = row['course2']
-            obj.peleng1 = row['peleng1']
-            obj.peleng2 = row['peleng2']
-            obj.type1 = row['type1']
-            obj.type2 = row['type2']
-            obj.save()
-        except:
-            continue
-    recording.n_scenarios = i
-    recording.save()
+def create_sc_for_rec(recording, chunk_bytes=None, progress=None):
+    """
+    Creates ScenarioResult rows and RecordingStats for recording stats file.
+    File is streamed in chunks of CSV rows or Parquet row groups and stats are folded per chunk,
+    so memory use is bounded by chunk size rather than by file size. Everything is written in one transaction.
+    Rows with unknown (or ambiguous) scenario names are skipped and counted.
+    @param recording:
+    @type recording: TestingRecording
+    @param chunk_bytes: CSV bytes per chunk, INGEST_CHUNK_BYTES by default
+    @param progress: callback progress(stage, rows_done, rows_total) called after every chunk
+    @return: (inserted, skipped)
+    """
+    started = time.monotonic()
+    inserted = total = 0
+    table = None
+    recording.sc_set_id = None
+    rows_total = file_cache.count_rows(recording.file.path) if progress else None
+    recording.canonical.name = canonical_name(recording)
+    with transaction.atomic():
+        # Concurrent ingests of one recording run one after another, otherwise the second one's DELETE
+        # misses rows inserted by the first one and results end up doubled
+        TestingRecording.objects.select_for_update().only('pk').get(pk=recording.pk)
+        with file_cache.CanonicalWriter(recording.canonical.path) as canonical:
+            ScenarioResultPayload.objects.filter(pack_id=recording.pk).delete()
+            ScenarioResult.objects.filter(pack_id=recording.pk).delete()
+            for chunk in file_cache.iter_stats_file(recording.file.path, chunk_bytes or INGEST_CHUNK_BYTES):
+                inserted += insert_results(recording, chunk)
+                canonical.write(chunk)
+                total += len(chunk)
+                if progress:
+                    progress(INGEST, total, rows_total)
+                chunk_table = count_by_distance(chunk)
+                table = chunk_table if table is None else table.add(chunk_table, fill_value=0)
+        recording.n_scenarios = total
+        TestingRecording.objects.filter(pk=recording.pk).update(n_scenarios=recording.n_scenarios,
+                                                                sc_set=recording.sc_set_id,
+                                                                canonical=recording.canonical.name)
+        RecordingStats.update_for(recording, table)
+    # Analytics read the canonical file from now on
+    file_cache.drop_cached(recording.file.path, recording.content_sha256)
+
+    skipped = total - inserted
+    elapsed = time.monotonic() - started
+    logger.info("Recording %s: inserted %d results, skipped %d rows with unknown scenarios "
+                "in %.1f s (%.0f rows/s)", recording.pk, inserted, skipped, elapsed,
+                total / elapsed if elapsed else 0)
+    return inserted, skipped
+
+
+def insert_results(recording, df):
+    """
+    Inserts ScenarioResult rows for a chunk of stats file.
+    Scenario names are resolved to ids in a few queries, rows are built column-wise and inserted with bulk_create.
+    Sets recording.sc_set from the first known scenario
+    @type recording: TestingRecording
+    @param df: stats file chunk
+    @return: number of inserted rows
+    """
+    names = scenario_names(df['datadir'])
+    scenarios = resolve_scenarios(names.unique())
+    scenario_ids = names.map(pd.Series({name: ids[0] for name, ids in scenarios.items()}, dtype='float64'))
+    known = scenario_ids.notna() & df['code'].notna()
+    rows = df[known]
+    scenario_ids = scenario_ids[known].astype('int64').tolist()
+
+    if scenario_ids and recording.sc_set_id is None:
+        recording.sc_set_id = scenarios[names[known].iloc[0]][1]
+
+    columns = {}
+    for field in RESULT_COLUMNS:
+        default = ScenarioResult._meta.get_field(field).default
+        if field in rows.columns:
+            columns[field] = rows[field].fillna(default).tolist()
+        else:
+            columns[field] = [default] * len(rows)
+    columns['code'] = [int(c) for c in columns['code']]
+
+    payloads = {field: rows[field].fillna('').astype(str).tolist() if field in rows.columns else [''] * len(rows)
+                for field in PAYLOAD_COLUMNS}
+
+    for start in range(0, len(scenario_ids), INGEST_BATCH_SIZE):
+        stop = start + INGEST_BATCH_SIZE
+        results = ScenarioResult.objects.bulk_create(
+            [ScenarioResult(pack_id=recording.pk, scenario_id=scenario_id,
+                            **{field: values[i] for field, values in columns.items()})
+             for i, scenario_id in enumerate(scenario_ids[start:stop], start)],
+            batch_size=INGEST_BATCH_SIZE)
+        # Results with empty texts get no payload row
+        ScenarioResultPayload.objects.bulk_create(
+            [ScenarioResultPayload(result_id=result.pk, pack_id=recording.pk,
+                                   **{field: values[i] for field, values in payloads.items()})
+             for i, result in enumerate(results, start) if any(values[i] for values in payloads.values())],
+            batch_size=INGEST_BATCH_SIZE)
+    return len(scenario_ids)
+
+
+def resolve_scenarios(names):
+    """
+    Resolves scenario names to ids with one query per LOOKUP_BATCH_SIZE names
+    @param names: scenario folder names
+    @return: dict name -> (scenario id, scenarios set id). Names matching several scenarios are left out
+    """
+    names = list(names)
+    found = {}
+    ambiguous = set()
+    for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+        chunk = names[start:start + LOOKUP_BATCH_SIZE]
+        for name, pk, set_id in Scenario.objects.filter(name__in=chunk).values_list('name', 'pk', 'scenariosSet_id'):
+            if name in found:
+                ambiguous.add(name)
+            found[name] = (pk, set_id)
+    for name in ambiguous:
+        del found[name]
+    return found
+
+
+def count_by_distance(df):
+    """
+    Counts scenarios per distance to the nearest target and result code
+    @param df: recording stats file
+    @return: pd.DataFrame with distances as index and codes as columns
+    """
+    dist = parse_datadirs(df['datadir'])['dist']
+    return pd.crosstab(dist, df['code'])
 
 
 def process_array(arr):
@@ -222,31 +425,64 @@ class ScenariosSet(models.Model):
     ci = models.IntegerField(default=0)
     vrf = models.IntegerField(default=0)
     vrb = models.IntegerField(default=0)
+    processed = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        if not self.processed:
+            Job.enqueue(LOAD_SCENARIOS_SET, scenarios_set=self)
+
+    @transaction.atomic
+    def load_metafile(self):
+        """
+        Creates scenarios listed in metafile with Postgres COPY and counts scenario types in one pass.
+        Runs atomically in background worker, so a failed load leaves no scenarios behind
+        """
+        started = time.monotonic()
         df = pd.read_csv(self.metafile.path)
-        self.n_cases = len(df['datadirs'])
-        for name in df['datadirs']:
-            obj = Scenario()
-            obj.name = os.path.split(name)[1]
-            obj.scenariosSet = self
-            # TODO: Fix types
-            # obj.type = ...
-            obj.save()
-        self.f2f = len(df[df['type1'] == "Face to face"])
-        self.ovn = len(df[df['type1'] == "Overtaken"])
-        self.ov = len(df[df['type1'] == "Overtake"])
-        self.gw = len(df[df['type1'] == "Give way"])
-        self.sve = len(df[df['type1'] == "Save"])
-        self.gwp = len(df[df['type1'] == "Give way priority"])
-        self.sp = len(df[df['type1'] == "Save priority"])
-        self.cm = len(df[df['type1'] == "Cross move"])
-        self.ci = len(df[df['type1'] == "Cross in"])
-        self.vrf = len(df[df['type1'] == "Vision restricted forward"])
-        self.vrb = len(df[df['type1'] == "Vision restricted backward"])
-        super().save(*args, **kwargs)
+        types = df['type1'] if 'type1' in df.columns else pd.Series(index=df.index, dtype=object)
+        names = scenario_names(df['datadirs'])
+        existing = set(self.scenario_set.values_list('name', flat=True))
+        # (scenariosSet, name) is unique, repeated metafile lines describe the same scenario
+        new = ~names.isin(existing) & ~names.duplicated()
+        geometry = scenario_geometry(names[new])
+        frame = geometry.assign(
+            name=names[new],
+            scenariosSet=self.pk,
+            type=types[new].map({name: code for code, name in TSS}).fillna(0).astype(int),
+            pelengs='{}',
+        )
+        # Indexes are built once over the whole table after COPY rather than updated row by row.
+        # That pays off when the set is larger than the table, e.g. the first one
+        bulk = len(frame) >= BULK_LOAD_MIN_ROWS and len(frame) > estimated_rows(Scenario)
+        with indexes_dropped(Scenario, [index.name for index in Scenario._meta.indexes]) if bulk \
+                else contextlib.nullcontext():
+            n_new = copy_frame(Scenario, frame)
 
+        self.n_cases = len(df['datadirs'])
+        type_counts = types.value_counts()
+        for name, field in TYPE_FIELDS.items():
+            setattr(self, field, int(type_counts.get(name, 0)))
+        self.processed = True
+        self.save()
+        logger.info("Scenarios set %s: created %d scenarios in %.1f s%s", self.pk, n_new,
+                    time.monotonic() - started, ', indexes rebuilt' if bulk else '')
+
+
+# ScenariosSet counter field for every type1 value of metafile
+TYPE_FIELDS = {
+    "Face to face": 'f2f',
+    "Overtaken": 'ovn',
+    "Overtake": 'ov',
+    "Give way": 'gw',
+    "Save": 'sve',
+    "Give way priority": 'gwp',
+    "Save priority": 'sp',
+    "Cross move": 'cm',
+    "Cross in": 'ci',
+    "Vision restricted forward": 'vrf',
+    "Vision restricted backward": 'vrb',
+}
 
 TSS = (
     (0, "Face to face"),
@@ -273,26 +509,42 @@ class Scenario(models.Model):
     pelengs = ArrayField(models.FloatField(), default=list)
     scenariosSet = models.ForeignKey(ScenariosSet, on_delete=models.CASCADE, default=1)
     type = models.IntegerField(choices=TSS, default=0)
+    # Distance to the nearest target and speed of the fastest one, None for scenarios without targets
+    min_dist = models.FloatField(default=None, null=True, blank=True)
+    max_vel = models.FloatField(default=None, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ingest resolves result folder names without knowing the set
+            models.Index(fields=['name'], name='scenario_name_idx'),
+            # Geometric filters, e.g. min_dist < 2 and max_vel > 15
+            models.Index(fields=['min_dist', 'max_vel'], name='scenario_min_dist_idx'),
+            models.Index(fields=['max_vel'], name='scenario_max_vel_idx'),
+            # Array containment and overlap: dists @> '{2.0}'
+            GinIndex(fields=['dists'], name='scenario_dists_gin'),
+            GinIndex(fields=['vels'], name='scenario_vels_gin'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['scenariosSet', 'name'], name='scenario_set_name_uniq'),
+        ]
 
     def save(self, *args, **kwargs):
-        try:
-            super().save(*args, **kwargs)
-            # TODO: rewrite this shit to file reading
-            # self.dist1 = names[1]
-            # self.dist2 = names[2]
-            # self.vel1 = names[3]
-            # self.vel2 = names[4]
-            # self.vel_our = names[5]
-            # self.course1 = names[6]
-            # self.course2 = names[7]
-            # if self.vel2 == self.course2 == 0:
-            #     self.num_targets = 1
-            # else:
-            #     self.num_targets = 2
-        except IndexError:
-            pass
+        if self.name and not self.dists:
+            self.fill_geometry()
         super().save(*args, **kwargs)
 
+    def fill_geometry(self):
+        """
+        Sets geometry fields from scenario name. Sets loaded from metafile get them in bulk in load_metafile
+        """
+        geometry = scenario_geometry(pd.Series([self.name])).iloc[0]
+        for field in ('dists', 'vels', 'courses'):
+            setattr(self, field, [float(v) for v in geometry[field].strip('{}').split(',') if v])
+        self.num_targets = int(geometry['num_targets'])
+        self.vel_our = float(geometry['vel_our'])
+        self.min_dist = None if pd.isna(geometry['min_dist']) else float(geometry['min_dist'])
+        self.max_vel = None if pd.isna(geometry['max_vel']) else float(geometry['max_vel'])
+
 
 STATUS = (
     (0, 'OK'),
@@ -309,8 +561,6 @@ class ScenarioResult(models.Model):
     pack = models.ForeignKey(TestingRecording, on_delete=models.CASCADE)
     code = models.IntegerField(choices=STATUS, default=0)
     exec_time = models.FloatField(default=0)
-    nav_report = models.TextField(default='', max_length=3000)
-    command = models.TextField(default='', max_length=3000)
     dist1 = models.FloatField(default=0)
     dist2 = models.FloatField(default=0)
     course1 = models.FloatField(default=0)
@@ -319,3 +569,174 @@ class ScenarioResult(models.Model):
     peleng2 = models.FloatField(default=0)
     type1 = models.TextField(default='', max_length=300)
     type2 = models.TextField(default='', max_length=300)
+
+    class Meta:
+        indexes = [
+            # Per-recording aggregates by code
+            models.Index(fields=['pack', 'code'], name='result_pack_code_idx'),
+            # Scenario history across recordings
+            models.Index(fields=['scenario', 'pack'], name='result_scenario_pack_idx'),
+        ]
+
+
+class ScenarioResultPayload(models.Model):
+    """
+    Navigation report and command texts of ScenarioResult. Kept apart so that scans over results
+    don't read the texts, they are loaded only for a single scenario
+    """
+    # Foreign key with ON DELETE CASCADE is added in migration 0033: Django sees no constraint to follow,
+    # so results are still deleted with a single DELETE and the database removes their payloads
+    result = models.OneToOneField(ScenarioResult, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  primary_key=True, related_name='payload')
+    pack = models.ForeignKey(TestingRecording, on_delete=models.CASCADE)
+    nav_report = models.TextField(default='', max_length=3000)
+    command = models.TextField(default='', max_length=3000)
+
+
+class RecordingStats(models.Model):
+    """
+    Scenario counts per distance to the nearest target and result code, computed once at ingest
+    """
+    recording = models.OneToOneField(TestingRecording, on_delete=models.CASCADE, primary_key=True,
+                                     related_name='stats')
+    dists = ArrayField(models.FloatField(), default=list)
+    codes = ArrayField(models.IntegerField(), default=list)
+    # counts[i][j] - number of scenarios with distance dists[i] and code codes[j]
+    counts = ArrayField(ArrayField(models.IntegerField()), default=list)
+    # totals[j] - number of scenarios with code codes[j]
+    totals = ArrayField(models.IntegerField(), default=list)
+
+    @classmethod
+    def update_for(cls, recording, table=None):
+        """
+        (Re)computes stats of recording
+        @type recording: TestingRecording
+        @param table: scenario counts from count_by_distance, counted from stats file if not given
+        @rtype: RecordingStats
+        """
+        if table is None:
+            for chunk in file_cache.iter_stats_file(recording.data_path, INGEST_CHUNK_BYTES, ['datadir', 'code']):
+                chunk_table = count_by_distance(chunk)
+                table = chunk_table if table is None else table.add(chunk_table, fill_value=0)
+        if table is None:
+            table = pd.DataFrame()
+        stats, _ = cls.objects.update_or_create(recording=recording, defaults={
+            'dists': table.index.astype(float).tolist(),
+            'codes': table.columns.astype(int).tolist(),
+            'counts': table.values.astype(int).tolist(),
+            'totals': table.sum(axis=0).astype(int).tolist(),
+        })
+        return stats
+
+    def to_dataframe(self):
+        """
+        Code percentage per distance
+        @rtype: pd.DataFrame
+        """
+        a = pd.DataFrame(self.counts, index=pd.Index(self.dists, name='dist'),
+                         columns=pd.Index(self.codes, name='code'))
+        asum = a.sum(axis=1)
+        return a.divide(asum, axis=0) * 100
+
+
+JOB_STATUS = (
+    (0, 'Queued'),
+    (1, 'Running'),
+    (2, 'Done'),
+    (3, 'Failed'),
+)
+
+# Job kinds, handlers are registered in jobs.py
+PROCESS_RECORDING = 'process_recording'
+LOAD_SCENARIOS_SET = 'load_scenarios_set'
+
+# Stages of recording processing reported to Job.stage
+FETCH_COMMIT = 'commit'
+INGEST = 'ingest'
+RENDER_PLOTS = 'plots'
+JOB_STAGES = (
+    (FETCH_COMMIT, 'Fetching commit'),
+    (INGEST, 'Loading results'),
+    (RENDER_PLOTS, 'Rendering plots'),
+)
+
+# Connection for Job.report, opened on first use in every worker process
+_progress_connection = None
+
+
+class Job(models.Model):
+    """
+    Background job, claimed and executed by `manage.py run_worker`
+    """
+    QUEUED, RUNNING, DONE, FAILED = range(4)
+
+    kind = models.TextField(max_length=100)
+    recording = models.ForeignKey(TestingRecording, on_delete=models.CASCADE, blank=True, null=True)
+    scenarios_set = models.ForeignKey(ScenariosSet, on_delete=models.CASCADE, blank=True, null=True)
+    status = models.IntegerField(choices=JOB_STATUS, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    created = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(default=None, null=True, blank=True)
+    finished = models.DateTimeField(default=None, null=True, blank=True)
+    duration = models.FloatField(default=0)
+    error = models.TextField(default='', blank=True)
+    # Progress of running job
+    stage = models.TextField(choices=JOB_STAGES, default='', blank=True, max_length=20)
+    rows_done = models.IntegerField(default=0)
+    rows_total = models.IntegerField(default=None, null=True, blank=True)
+    updated = models.DateTimeField(default=None, null=True, blank=True)
+    # Jobs queued together, e.g. by recalculate_statistics admin action, share it
+    batch = models.UUIDField(default=None, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['batch'], name='job_batch_idx', condition=models.Q(batch__isnull=False)),
+        ]
+
+    def report(self, stage, rows_done=0, rows_total=None):
+        """
+        Saves job progress through a separate autocommit connection,
+        so pollers see it while ingest transaction is still open
+        @param stage: one of JOB_STAGES
+        @param rows_done: rows processed so far
+        @param rows_total: rows to process, None if unknown
+        """
+        global _progress_connection
+        self.stage, self.rows_done, self.rows_total, self.updated = stage, rows_done, rows_total, timezone.now()
+        sql = (f'UPDATE {self._meta.db_table} SET stage = %s, rows_done = %s, rows_total = %s, '
+               f'updated = %s WHERE id = %s')
+        params = [self.stage, self.rows_done, self.rows_total, self.updated, self.pk]
+        # The connection outlives jobs, after a database restart it is opened again once
+        for attempt in range(2):
+            if _progress_connection is None:
+                _progress_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                with _progress_connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                return
+            except (InterfaceError, OperationalError):
+                _progress_connection.close()
+                _progress_connection = None
+                if attempt:
+                    raise
+
+    @classmethod
+    def enqueue(cls, kind, **kwargs):
+        """
+        Adds job to queue unless the same job is already waiting there
+        @param kind: PROCESS_RECORDING or LOAD_SCENARIOS_SET
+        @param kwargs: job target, e.g. recording=...
+        @rtype: Job
+        """
+        # A running job may have read its input before the change, so it gets a follow-up job.
+        # Ingests of one recording are serialized by a row lock, the follow-up waits for the running one
+        job = cls.objects.filter(kind=kind, status=cls.QUEUED, **kwargs).first()
+        if job is None:
+            job = cls.objects.create(kind=kind, **kwargs)
+        return job
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk}'
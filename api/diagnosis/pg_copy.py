@@ -0,0 +1,110 @@
+"""
+Bulk loading of DataFrames into Postgres with COPY
+"""
+import contextlib
+import csv
+import io
+
+from django.db import connection
+
+
+def _copy_options(model, names):
+    """
+    COPY options for columns of model fields names. pandas quotes NaN written with QUOTE_NONNUMERIC,
+    so quoted empty fields of nullable non-text columns are read as NULL
+    """
+    nullable = [connection.ops.quote_name(model._meta.get_field(name).column) for name in names
+                if model._meta.get_field(name).null
+                and model._meta.get_field(name).get_internal_type() not in ('TextField', 'CharField')]
+    return 'FORMAT csv' + (f', FORCE_NULL ({", ".join(nullable)})' if nullable else '')
+
+
+def copy_frame(model, df):
+    """
+    Inserts DataFrame rows into model table with COPY ... FROM STDIN.
+    Model save() and field defaults are bypassed: df must hold a value for every non-null column
+    except the primary key. Array columns take Postgres literals such as '{1.5,2}'
+    @param model: Django model class
+    @param df: pd.DataFrame with columns named after model fields
+    @return: number of inserted rows
+    """
+    if df.empty:
+        return 0
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in df.columns)
+    buf = io.StringIO()
+    # Empty strings stay strings, NaN of nullable columns become NULL
+    df.to_csv(buf, index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+    buf.seek(0)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN '
+            f'WITH ({_copy_options(model, df.columns)})', buf)
+    return len(df)
+
+
+def update_frame(model, df):
+    """
+    Updates model rows from DataFrame: rows are copied into a temporary table with COPY
+    and applied with one UPDATE ... FROM joined on primary key
+    @param model: Django model class
+    @param df: pd.DataFrame with primary key column and columns to update, named after model fields
+    @return: number of updated rows
+    """
+    if df.empty:
+        return 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    names = [name for name in df.columns if name != model._meta.pk.name]
+    columns = [connection.ops.quote_name(model._meta.get_field(name).column) for name in names]
+    buf = io.StringIO()
+    df[[model._meta.pk.name] + names].to_csv(buf, index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+    buf.seek(0)
+    with connection.cursor() as cursor:
+        # Left over by a failed call on the same connection
+        cursor.execute('DROP TABLE IF EXISTS pg_copy_update')
+        cursor.execute(f'CREATE TEMPORARY TABLE pg_copy_update AS '
+                       f'SELECT {pk}, {", ".join(columns)} FROM {table} WITH NO DATA')
+        cursor.cursor.copy_expert(f'COPY pg_copy_update ({pk}, {", ".join(columns)}) FROM STDIN '
+                                  f'WITH ({_copy_options(model, names)})', buf)
+        cursor.execute(f'UPDATE {table} t SET {", ".join(f"{c} = u.{c}" for c in columns)} '
+                       f'FROM pg_copy_update u WHERE t.{pk} = u.{pk}')
+        updated = cursor.rowcount
+        cursor.execute('DROP TABLE pg_copy_update')
+    return updated
+
+
+def estimated_rows(model):
+    """
+    Number of rows of model table estimated by the planner statistics, without counting them
+    @rtype: int
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 for tables never analyzed
+    return max(int(row[0]), 0) if row else 0
+
+
+@contextlib.contextmanager
+def indexes_dropped(model, names):
+    """
+    Drops indexes of model table for a bulk load and builds them again after it, in the current transaction.
+    Building an index once is cheaper than updating it row by row when the load is larger than the table.
+    Until commit the table is locked even for reads
+    @param model: Django model class
+    @param names: index names
+    """
+    assert connection.in_atomic_block, 'indexes must be dropped and created in one transaction'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname = ANY(%s)',
+                       [model._meta.db_table, list(names)])
+        definitions = cursor.fetchall()
+        for name, _ in definitions:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    yield
+    with connection.cursor() as cursor:
+        # Indexes can't be built while loaded rows have pending deferred foreign key checks
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for _, definition in definitions:
+            cursor.execute(definition)
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
@@ -0,0 +1,98 @@
+"""
+Rendered plots of recordings, cached on disk under MEDIA_ROOT/plots/<recording pk>/.
+File names include recording version, so reprocessed recordings never serve stale images.
+"""
+import io
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from matplotlib import pyplot as plt
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+PLOTS_DIR = os.path.join(settings.MEDIA_ROOT, 'plots')
+GRAPH_TYPES = ('normal', 'minister')
+# Figure is 10x6 inches, dpi defines the size in pixels
+SIZES = {
+    'large': 200,
+    'medium': 100,
+    'small': 50,
+}
+DEFAULT_SIZE = 'large'
+
+
+def normalize(graph_type, size):
+    """
+    Maps unknown graph types and sizes to defaults, so they share cache entries
+    @return: (graph_type, size)
+    """
+    return (graph_type if graph_type in GRAPH_TYPES else 'normal',
+            size if size in SIZES else DEFAULT_SIZE)
+
+
+def plot_etag(recording, graph_type, size):
+    graph_type, size = normalize(graph_type, size)
+    return f'{recording.pk}-{recording.version}-{graph_type}-{size}'
+
+
+def plot_path(recording, graph_type, size):
+    graph_type, size = normalize(graph_type, size)
+    return os.path.join(PLOTS_DIR, str(recording.pk), f'{recording.version}_{graph_type}_{size}.png')
+
+
+def render(recording, graph_type, size):
+    """
+    Renders plot to PNG
+    @rtype: bytes
+    """
+    graph_type, size = normalize(graph_type, size)
+    fig = recording.gen_plot(graph_type, dpi=SIZES[size])
+    buf = io.BytesIO()
+    try:
+        with timing.span('png'):
+            fig.savefig(buf, format='png')
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
+
+
+def get_plot(recording, graph_type, size):
+    """
+    PNG plot of recording, rendered on first request
+    @rtype: bytes
+    """
+    path = plot_path(recording, graph_type, size)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    png = render(recording, graph_type, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+    return png
+
+
+def prerender(recording):
+    """
+    Renders default size plots of every type, so the first visitors don't wait for matplotlib
+    """
+    for graph_type in GRAPH_TYPES:
+        try:
+            get_plot(recording, graph_type, DEFAULT_SIZE)
+        except Exception:
+            logger.exception("Couldn't render %s plot of recording %s", graph_type, recording.pk)
+
+
+def invalidate(recording):
+    """
+    Removes every cached plot of recording
+    """
+    shutil.rmtree(os.path.join(PLOTS_DIR, str(recording.pk)), ignore_errors=True)
@@ -0,0 +1,97 @@
+"""
+Synthetic scenario data for benchmarks
+"""
+import numpy as np
+import pandas as pd
+
+
+def scenario_names(n, n_targets=2, seed=0, prefix='sc'):
+    """
+    Generates scenario folder names in the format parsed by datadir.parse_datadirs.
+    About a half of scenarios of multi-target sets have a single target
+    @param n: number of names
+    @param n_targets: targets per scenario in the set
+    @param seed: random seed
+    @param prefix: name prefix without underscores, scenarios of different sets must not share names
+    @rtype: pd.Series
+    """
+    rng = np.random.default_rng(seed)
+    dists = rng.integers(1, 25, (n, n_targets)) * 0.5
+    vels = rng.integers(3, 30, (n, n_targets)).astype(float)
+    courses = rng.integers(0, 360, (n, n_targets)).astype(float)
+    if n_targets > 1:
+        absent = np.zeros((n, n_targets), dtype=bool)
+        absent[:, 1:] = rng.random((n, 1)) < 0.5
+        dists[absent] = vels[absent] = courses[absent] = 0
+    vel_our = rng.integers(5, 20, n).astype(float)
+    columns = [pd.Series(np.arange(n)).map((prefix + '{}').format)]
+    columns += [pd.Series(a[:, i]).astype(str) for a in (dists, vels) for i in range(n_targets)]
+    columns += [pd.Series(vel_our).astype(str)]
+    columns += [pd.Series(courses[:, i]).astype(str) for i in range(n_targets)]
+    return columns[0].str.cat(columns[1:], sep='_')
+
+
+SCENARIO_TYPES = ("Face to face", "Overtaken", "Overtake", "Give way", "Save", "Give way priority", "Save priority",
+                  "Cross move", "Cross in", "Vision restricted forward", "Vision restricted backward")
+
+
+def results_frame(n, n_targets=2, seed=0, text_size=1000, prefix='sc'):
+    """
+    Generates recording stats file in the format of bks-report
+    @param n: number of scenarios
+    @param n_targets: targets per scenario in the set
+    @param seed: random seed
+    @param text_size: approximate length of nav_report and command texts
+    @param prefix: scenario name prefix
+    @rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    names = scenario_names(n, n_targets, seed, prefix)
+    fields = names.str.split('_', expand=True)
+    dist1 = fields[1].astype(float)
+    dist2 = fields[2].astype(float) if n_targets > 1 else pd.Series(0.0, index=names.index)
+    type2 = pd.Series(rng.choice(SCENARIO_TYPES, n)).where(dist2 > 0)
+    return pd.DataFrame({
+        'datadir': '/data/scenarios/' + names,
+        'code': rng.choice([0, 1, 2, 3, 4, 5], n, p=[0.6, 0.15, 0.15, 0.02, 0.03, 0.05]),
+        'exec_time': rng.lognormal(-1, 0.5, n),
+        'nav_report': ('{"report": "' + 'x' * text_size + '"}'),
+        'command': ('{"maneuver": "' + 'y' * text_size + '"}'),
+        'dist1': dist1,
+        'dist2': dist2,
+        'course1': rng.integers(0, 360, n).astype(float),
+        'course2': np.where(dist2 > 0, rng.integers(0, 360, n), 0).astype(float),
+        'peleng1': rng.integers(0, 360, n).astype(float),
+        'peleng2': np.where(dist2 > 0, rng.integers(0, 360, n), 0).astype(float),
+        'type1': rng.choice(SCENARIO_TYPES, n),
+        'type2': type2,
+    })
+
+
+def meta_frame(n, n_targets=2, seed=0, prefix='sc'):
+    """
+    Generates scenarios set metafile matching results_frame with the same arguments
+    @rtype: pd.DataFrame
+    """
+    results = results_frame(n, n_targets, seed, text_size=0, prefix=prefix)
+    return pd.DataFrame({'datadirs': results['datadir'], 'type1': results['type1']})
+
+
+# Rows limit of an XLSX sheet including the header
+XLSX_MAX_ROWS = 1048575
+
+
+def write_frame(df, path, row_group_size=50000):
+    """
+    Writes frame in the format given by path extension: csv, xlsx or parquet
+    @param row_group_size: Parquet rows per row group, ingest streams the file by row group
+    """
+    file_extension = path.split('.')[-1]
+    if file_extension == 'parquet':
+        df.to_parquet(path, engine='fastparquet', index=False, row_group_offsets=row_group_size)
+    elif file_extension == 'xlsx':
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"XLSX sheet can't hold {len(df)} rows")
+        df.to_excel(path, index=False, engine='openpyxl')
+    else:
+        df.to_csv(path, index=False)
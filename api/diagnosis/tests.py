@@ -1 +1,535 @@
-# Create your tests here.
+import datetime
+import json
+import math
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.core.files.base import ContentFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from . import api, file_cache, gitgub_utils, jobs, models
+from .datadir import parse_datadirs, scenario_geometry
+from .management.commands import run_worker
+from .models import Job, Scenario, ScenariosSet, TestingRecording, PROCESS_RECORDING, create_sc_for_rec
+from .synthetic import meta_frame, results_frame
+
+
+class DuplicateRecordingTests(TestCase):
+    def recording(self, title, duplicate_of=None):
+        return TestingRecording.objects.create(title=title, file=f'{title}.csv', content_sha256='a' * 64,
+                                               duplicate_of=duplicate_of)
+
+    def test_delete_original_promotes_oldest_duplicate(self):
+        original = self.recording('original')
+        first = self.recording('first', original)
+        second = self.recording('second', original)
+        original.delete()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNone(first.duplicate_of)
+        self.assertEqual(second.duplicate_of, first)
+
+    def test_delete_original_with_duplicate_in_one_queryset(self):
+        original = self.recording('original')
+        first = self.recording('first', original)
+        second = self.recording('second', original)
+        TestingRecording.objects.filter(pk__in=[original.pk, first.pk]).delete()
+        second.refresh_from_db()
+        self.assertIsNone(second.duplicate_of)
+
+    def test_delete_duplicate_keeps_original(self):
+        original = self.recording('original')
+        self.recording('first', original).delete()
+        original.refresh_from_db()
+        self.assertEqual(original.content_sha256, 'a' * 64)
+        self.assertFalse(original.duplicates.exists())
+
+
+class GitHubStub(BaseHTTPRequestHandler):
+    """
+    GitHub API stub: repository descriptor, commits, a commit failing with 503 the first `failures` times
+    and a commit answering after `delay` seconds. Requests are counted per path
+    """
+    failures = 0
+    delay = 0
+    hits = Counter()
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        base = f'http://{self.headers["Host"]}'
+        if self.path == '/repos/owner/repo':
+            self.reply(200, {'commits_url': base + '/repos/owner/repo/commits{/sha}'})
+        elif self.path == '/repos/owner/repo/commits/flaky' and self.hits[self.path] <= self.failures:
+            self.reply(503, {'message': 'Service Unavailable'})
+        elif self.path == '/repos/owner/repo/commits/slow':
+            time.sleep(self.delay)
+            self.reply(200, {})
+        elif self.path.startswith('/repos/owner/repo/commits/'):
+            sha1 = self.path.rsplit('/', 1)[1]
+            self.reply(200, {'sha': sha1, 'commit': {'message': f'commit {sha1}',
+                                                     'author': {'date': '2021-10-01T12:00:00Z'}}})
+        else:
+            self.reply(404, {'message': 'Not Found'})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class GitHubClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubStub)
+        # The client gives up on slow responses, writing them to a closed socket is expected
+        cls.server.handle_error = lambda request, client_address: None
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.repo_url = f'http://127.0.0.1:{cls.server.server_port}/repos/owner/repo'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        GitHubStub.hits.clear()
+        GitHubStub.failures = GitHubStub.delay = 0
+        gitgub_utils._commits_urls.clear()
+        gitgub_utils._session = None
+
+    def test_commits_url_fetched_once(self):
+        self.assertEqual(gitgub_utils.get_commit(self.repo_url, 'a1', None)['sha'], 'a1')
+        self.assertEqual(gitgub_utils.get_commit(self.repo_url, 'b2', None)['sha'], 'b2')
+        self.assertEqual(GitHubStub.hits['/repos/owner/repo'], 1)
+
+    def test_failed_descriptor_is_not_cached(self):
+        with self.assertLogs('diagnosis.gitgub_utils', 'WARNING'):
+            self.assertIsNone(gitgub_utils.get_commit(self.repo_url + 'x', 'a1', None))
+        self.assertNotIn(self.repo_url + 'x', gitgub_utils._commits_urls)
+
+    def test_server_errors_are_retried(self):
+        GitHubStub.failures = 2
+        self.assertEqual(gitgub_utils.get_commit(self.repo_url, 'flaky', None)['sha'], 'flaky')
+        self.assertEqual(GitHubStub.hits['/repos/owner/repo/commits/flaky'], 3)
+
+    def test_retries_are_limited(self):
+        GitHubStub.failures = 10
+        with self.assertLogs('diagnosis.gitgub_utils', 'WARNING'):
+            self.assertIsNone(gitgub_utils.get_commit(self.repo_url, 'flaky', None))
+        self.assertEqual(GitHubStub.hits['/repos/owner/repo/commits/flaky'], 1 + gitgub_utils.RETRIES.total)
+
+    def test_read_timeout_is_not_retried(self):
+        GitHubStub.delay = 1
+        with mock.patch.object(gitgub_utils, 'TIMEOUT', (1, 0.2)), \
+                self.assertLogs('diagnosis.gitgub_utils', 'WARNING'):
+            started = time.monotonic()
+            self.assertIsNone(gitgub_utils.get_commit(self.repo_url, 'slow', None))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(GitHubStub.hits['/repos/owner/repo/commits/slow'], 1)
+
+    def test_connection_refused(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        with self.assertLogs('diagnosis.gitgub_utils', 'WARNING'):
+            self.assertIsNone(gitgub_utils.get_commit(f'http://127.0.0.1:{port}/repos/owner/repo', 'a1', None))
+
+
+def legacy_get_distance(foldername):
+    """
+    Distance to the nearest target as TestingRecording.count_by_distance computed it before parse_datadirs,
+    for scenario sets of two targets
+    """
+    def get_n_targets(name):
+        foldername = os.path.split(name)[1]
+        foldername2 = foldername.split(sep="_")
+        if float(foldername2[1]) == 0 or float(foldername2[2]) == 0:
+            return 1
+        else:
+            return 2
+
+    foldername = os.path.split(foldername)[1]
+    n_targ = get_n_targets(foldername)
+    foldername2 = foldername.split(sep="_")
+    if n_targ == 1:
+        return max(float(foldername2[1]), float(foldername2[2]))
+    elif n_targ == 2:
+        return min(float(foldername2[1]), float(foldername2[2]))
+
+
+NAN = float('nan')
+# datadir, n_targets, dist, dists, vels, courses, vel_our, max_vel
+DATADIRS = [
+    # Two targets, the format the legacy parser knew
+    ('/data/scenarios/sc1_2.5_4.0_10.0_12.0_8.0_90.0_270.0', 2, 2.5, '{2.5,4.0}', '{10.0,12.0}', '{90.0,270.0}',
+     8.0, 12.0),
+    ('sc2_3.0_0.0_10.0_0.0_8.0_45.0_0.0', 1, 3.0, '{3.0}', '{10.0}', '{45.0}', 8.0, 10.0),
+    ('sc3_0.0_5.0_0.0_12.0_8.0_0.0_270.0', 1, 5.0, '{5.0}', '{12.0}', '{270.0}', 8.0, 12.0),
+    ('sc4_0.0_0.0_5.0_6.0_8.0_0.0_0.0', 0, 0.0, '{}', '{}', '{}', 8.0, NAN),
+    # One and three targets
+    ('sc5_3.5_10.0_8.0_45.0', 1, 3.5, '{3.5}', '{10.0}', '{45.0}', 8.0, 10.0),
+    ('sc6_3.0_1.5_6.0_10.0_11.0_12.0_8.0_0.0_90.0_180.0', 3, 1.5, '{3.0,1.5,6.0}', '{10.0,11.0,12.0}',
+     '{0.0,90.0,180.0}', 8.0, 12.0),
+    # Malformed names and missing datadirs have no geometry
+    ('garbage', 0, NAN, '{}', '{}', '{}', 0.0, NAN),
+    ('sc7_1.0_2.0', 0, NAN, '{}', '{}', '{}', 0.0, NAN),
+    ('sc8_x_4.0_10.0_12.0_8.0_90.0_270.0', 0, NAN, '{}', '{}', '{}', 0.0, NAN),
+    ('', 0, NAN, '{}', '{}', '{}', 0.0, NAN),
+    (NAN, 0, NAN, '{}', '{}', '{}', 0.0, NAN),
+]
+
+
+class DatadirTests(SimpleTestCase):
+    def assertFloatEqual(self, first, second):
+        if math.isnan(second):
+            self.assertTrue(math.isnan(first), first)
+        else:
+            self.assertEqual(first, second)
+
+    def check(self, datadirs, cases):
+        parsed = parse_datadirs(datadirs)
+        geometry = scenario_geometry(datadirs)
+        for i, (datadir, n_targets, dist, dists, vels, courses, vel_our, max_vel) in zip(datadirs.index, cases):
+            with self.subTest(datadir=datadir):
+                self.assertEqual(parsed.at[i, 'n_targets'], n_targets)
+                self.assertFloatEqual(parsed.at[i, 'dist'], dist)
+                row = geometry.loc[i]
+                self.assertEqual(row['num_targets'], n_targets)
+                self.assertEqual((row['dists'], row['vels'], row['courses']), (dists, vels, courses))
+                self.assertEqual(row['vel_our'], vel_our)
+                self.assertFloatEqual(row['min_dist'], dist if n_targets else NAN)
+                self.assertFloatEqual(row['max_vel'], max_vel)
+
+    def test_every_name_alone(self):
+        for case in DATADIRS:
+            self.check(pd.Series([case[0]], index=[7]), [case])
+
+    def test_names_together(self):
+        # Names of different target counts in one call share the columns of the largest one
+        self.check(pd.Series([case[0] for case in DATADIRS]), DATADIRS)
+
+    def test_no_names(self):
+        self.assertEqual(len(parse_datadirs(pd.Series([], dtype=object))), 0)
+        self.assertEqual(len(scenario_geometry(pd.Series([], dtype=object))), 0)
+
+    def test_matches_legacy_get_distance(self):
+        # Two target names, either or both distances may be zero
+        fields = np.random.default_rng(0).integers(0, 20, (500, 6)) * [0.5, 0.5, 1, 1, 10, 10]
+        datadirs = pd.Series([f'/data/scenarios/sc{i}_{d1}_{d2}_{v1}_{v2}_8.0_{c1}_{c2}'
+                              for i, (d1, d2, v1, v2, c1, c2) in enumerate(fields)])
+        expected = datadirs.map(legacy_get_distance)
+        self.assertTrue((parse_datadirs(datadirs)['dist'] == expected).all())
+        present = expected > 0
+        self.assertTrue((scenario_geometry(datadirs)['min_dist'][present] == expected[present]).all())
+
+    def test_legacy_get_distance_fails_where_parser_gives_nan(self):
+        for datadir in ('garbage', 'sc8_x_4.0_10.0_12.0_8.0_90.0_270.0'):
+            with self.subTest(datadir=datadir), self.assertRaises((ValueError, IndexError)):
+                legacy_get_distance(datadir)
+
+
+def failing_job(job):
+    raise ValueError('broken stats file')
+
+
+def interrupted_job(job):
+    raise jobs.Interrupted
+
+
+@mock.patch.dict(jobs.HANDLERS, {'ok': lambda job: None, 'fail': failing_job, 'interrupt': interrupted_job})
+class JobTests(TestCase):
+    def test_claims_due_jobs_in_order(self):
+        Job.objects.create(kind='ok', run_after=timezone.now() + datetime.timedelta(minutes=1))
+        first = Job.objects.create(kind='ok')
+        second = Job.objects.create(kind='ok')
+        self.assertEqual(jobs.claim_job(), first)
+        self.assertEqual(jobs.claim_job(), second)
+        self.assertIsNone(jobs.claim_job())
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (Job.RUNNING, 1))
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = Job.objects.create(kind='fail', max_attempts=3)
+        for attempt in range(1, 3):
+            with self.assertLogs('diagnosis.jobs', 'ERROR'):
+                jobs.run_job(jobs.claim_job())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempt))
+            self.assertIn('broken stats file', job.error)
+            delay = job.run_after - job.finished
+            self.assertAlmostEqual(delay.total_seconds(), jobs.RETRY_BASE_DELAY.total_seconds() * 2 ** (attempt - 1),
+                                   delta=1)
+            self.assertIsNone(jobs.claim_job())
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('diagnosis.jobs', 'ERROR'):
+            jobs.run_job(jobs.claim_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+
+    def test_stale_running_job_is_claimed_again(self):
+        now = timezone.now()
+        alive = Job.objects.create(kind='ok', status=Job.RUNNING, attempts=1, started=now - datetime.timedelta(hours=3),
+                                   updated=now - jobs.STALE_AFTER / 2)
+        lost = Job.objects.create(kind='ok', status=Job.RUNNING, attempts=1, started=now - jobs.STALE_AFTER / 2,
+                                  updated=now - jobs.STALE_AFTER * 2)
+        # Lost before its first heartbeat
+        never_reported = Job.objects.create(kind='ok', status=Job.RUNNING, attempts=1,
+                                            started=now - jobs.STALE_AFTER * 2)
+        self.assertEqual(jobs.claim_job(), lost)
+        self.assertEqual(jobs.claim_job(), never_reported)
+        self.assertIsNone(jobs.claim_job())
+        lost.refresh_from_db()
+        self.assertEqual(lost.attempts, 2)
+        self.assertGreater(lost.updated, now)
+        alive.refresh_from_db()
+        self.assertEqual(alive.attempts, 1)
+
+    def test_interrupted_job_is_queued_again(self):
+        job = Job.objects.create(kind='interrupt')
+        with self.assertRaises(jobs.Interrupted):
+            jobs.run_job(jobs.claim_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 0))
+        self.assertEqual(jobs.claim_job(), job)
+
+    def test_enqueue_follows_running_job(self):
+        recording = TestingRecording.objects.create(title='rec', file='rec.csv')
+        queued = Job.objects.get(recording=recording)
+        self.assertEqual(Job.enqueue(PROCESS_RECORDING, recording=recording), queued)
+        jobs.claim_job()
+        follow_up = Job.enqueue(PROCESS_RECORDING, recording=recording)
+        self.assertNotEqual(follow_up, queued)
+        self.assertEqual(follow_up.status, Job.QUEUED)
+
+
+@mock.patch.dict(jobs.HANDLERS, {'ok': lambda job: None})
+class WorkerTests(TransactionTestCase):
+    def test_concurrent_claims_skip_locked_jobs(self):
+        first = Job.objects.create(kind='ok')
+        second = Job.objects.create(kind='ok')
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_first():
+            try:
+                with transaction.atomic():
+                    Job.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_first)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(jobs.claim_job(), second)
+            self.assertIsNone(jobs.claim_job())
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(jobs.claim_job(), first)
+
+    def test_heartbeat_of_running_job(self):
+        job = Job.objects.create(kind='slow')
+        updated = []
+
+        def slow(job):
+            time.sleep(0.5)
+            updated.append(Job.objects.get(pk=job.pk).updated)
+
+        with mock.patch.dict(jobs.HANDLERS, {'slow': slow}), \
+                mock.patch.object(jobs, 'HEARTBEAT_INTERVAL', datetime.timedelta(seconds=0.1)):
+            claimed = jobs.claim_job()
+            jobs.run_job(claimed)
+        self.assertGreater(updated[0], claimed.started)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_worker_survives_database_error(self):
+        job = Job.objects.create(kind='ok')
+        claims = []
+
+        def claim_after_disconnect():
+            claims.append(None)
+            if len(claims) == 1:
+                # The server drops the connection, like on a database restart
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_terminate_backend(pg_backend_pid())')
+            return jobs.claim_job()
+
+        with mock.patch.object(run_worker, 'claim_job', claim_after_disconnect), \
+                self.assertLogs(run_worker.logger, 'ERROR'):
+            run_worker.loop(poll_interval=0, once=True)
+        self.assertEqual(len(claims), 3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+
+class ETagTests(TestCase):
+    def setUp(self):
+        self.recording = TestingRecording.objects.create(title='rec', file='rec.csv', slug='rec', processed=True)
+        self.previous = TestingRecording.objects.create(title='prev', file='prev.csv', slug='prev', processed=True)
+
+    def etag(self, function, url):
+        request = RequestFactory().get(url)
+        request.resolver_match = resolve(request.path)
+        return function(request, **request.resolver_match.kwargs)
+
+    def test_query_parameters_change_etag(self):
+        url = '/api/v1/recordings/rec/exec_time'
+        self.assertNotEqual(self.etag(api._recording_etag, url + '?bins=10'),
+                            self.etag(api._recording_etag, url + '?bins=20'))
+        self.assertNotEqual(self.etag(api._recording_etag, url), self.etag(api._recording_etag, url + '?bins=20'))
+
+    def test_query_parameters_order_keeps_etag(self):
+        url = '/api/v1/recordings/rec/slowdowns'
+        self.assertEqual(self.etag(api._compare_etag, url + '?prev=prev&threshold=2&limit=5'),
+                         self.etag(api._compare_etag, url + '?limit=5&threshold=2&prev=prev'))
+
+    def test_new_version_changes_etag(self):
+        url = '/api/v1/recordings/rec/compare?prev=prev'
+        before = self.etag(api._compare_etag, url)
+        TestingRecording.objects.filter(pk=self.previous.pk).update(version=1)
+        self.assertNotEqual(self.etag(api._compare_etag, url), before)
+        self.assertIsNone(self.etag(api._compare_etag, '/api/v1/recordings/rec/compare?prev=missing'))
+
+
+class MediaTestCase(TestCase):
+    """
+    Keeps uploaded and derived files in a temporary MEDIA_ROOT
+    """
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache_dir = mock.patch.object(file_cache, 'CACHE_DIR', os.path.join(media, 'cache'))
+        cache_dir.start()
+        self.addCleanup(cache_dir.stop)
+
+    def scenarios_set(self, n, prefix):
+        scenarios_set = ScenariosSet(processed=True, n_targets=2)
+        scenarios_set.metafile.save('meta.csv', ContentFile(meta_frame(n, prefix=prefix).to_csv(index=False)))
+        scenarios_set.load_metafile()
+        return scenarios_set
+
+    def recording(self, df):
+        recording = TestingRecording(title='rec', n_targets=2, processed=True)
+        recording.file.save('rec.csv', ContentFile(df.to_csv(index=False)))
+        create_sc_for_rec(recording)
+        return recording
+
+
+class PivotTests(MediaTestCase):
+    def expected(self, df):
+        types = df.melt(id_vars=['datadir', 'code'], value_vars=['type1', 'type2'], value_name='type')
+        counts = pd.crosstab(types['type'], types['code'])
+        return counts.divide(counts.sum(axis=1), axis=0) * 100
+
+    def assertPivotEqual(self, pivot, expected):
+        # The file fallback reads categorical types of the canonical file
+        pivot = pivot.set_axis(pivot.index.astype(str), axis=0).set_axis(pivot.columns.astype(int), axis=1)
+        pd.testing.assert_frame_equal(pivot, expected, check_names=False, check_dtype=False,
+                                      check_index_type=False, check_column_type=False)
+
+    def test_pivot_of_known_scenarios(self):
+        self.scenarios_set(200, 'pv')
+        df = results_frame(200, prefix='pv', text_size=10)
+        recording = self.recording(df)
+        with mock.patch('diagnosis.models.load_df_from_rec') as load:
+            pivot = recording.pivot_scenario_types()
+        load.assert_not_called()
+        self.assertPivotEqual(pivot, self.expected(df))
+
+    def test_pivot_counts_unknown_scenarios_like_chart(self):
+        self.scenarios_set(200, 'pv')
+        df = pd.concat([results_frame(200, prefix='pv', text_size=10),
+                        results_frame(50, prefix='unknown', seed=1, text_size=10)], ignore_index=True)
+        recording = self.recording(df)
+        self.assertEqual(recording.scenarioresult_set.count(), 200)
+        self.assertEqual(sum(recording.stats.totals), 250)
+        self.assertPivotEqual(recording.pivot_scenario_types(), self.expected(df))
+
+
+class FileCacheTests(MediaTestCase):
+    def stats_file(self, name, rows, seed=0):
+        path = os.path.join(tempfile.mkdtemp(dir=file_cache.settings.MEDIA_ROOT), name)
+        results_frame(rows, seed=seed, text_size=10).to_csv(path, index=False)
+        return path
+
+    def cached(self):
+        return sorted(os.listdir(file_cache.CACHE_DIR)) if os.path.isdir(file_cache.CACHE_DIR) else []
+
+    def test_ingest_drops_parsed_copy(self):
+        self.scenarios_set(100, 'sc')
+        recording = self.recording(results_frame(100, text_size=10))
+        TestingRecording.objects.filter(pk=recording.pk).update(canonical='')
+        recording.refresh_from_db()
+        file_cache.load_frame(recording.data_path)
+        self.assertEqual(self.cached(), [file_cache.file_digest(recording.file.path) + '.parquet'])
+        create_sc_for_rec(recording)
+        self.assertEqual(self.cached(), [])
+
+    def test_least_recently_read_files_are_evicted(self):
+        paths = [self.stats_file(f'{i}.csv', 1000, seed=i) for i in range(3)]
+        # Frames aren't kept in memory, every load reads the disk cache
+        with mock.patch.object(file_cache, 'MAX_BYTES', 0):
+            file_cache.load_frame(paths[0])
+        size = os.path.getsize(os.path.join(file_cache.CACHE_DIR, self.cached()[0]))
+        with mock.patch.object(file_cache, 'DISK_MAX_BYTES', size * 2.5), \
+                mock.patch.object(file_cache, 'MAX_BYTES', 0):
+            file_cache.load_frame(paths[1])
+            # Reading the first file again makes the second one the oldest
+            past = time.time() - 60
+            for path in paths[:2]:
+                cached = os.path.join(file_cache.CACHE_DIR, file_cache.file_digest(path) + '.parquet')
+                os.utime(cached, (past, past))
+            file_cache.load_frame(paths[0])
+            file_cache.load_frame(paths[2])
+        self.assertEqual(self.cached(), sorted(file_cache.file_digest(path) + '.parquet'
+                                               for path in (paths[0], paths[2])))
+
+
+class ScenariosSetLoadTests(MediaTestCase):
+    def indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [Scenario._meta.db_table])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_bulk_load_rebuilds_indexes(self):
+        indexes = self.indexes()
+        self.assertTrue({index.name for index in Scenario._meta.indexes} <= indexes)
+        with mock.patch.object(models, 'BULK_LOAD_MIN_ROWS', 10), \
+                self.assertLogs('diagnosis.models', 'INFO') as logs:
+            scenarios_set = self.scenarios_set(100, 'bulk')
+        self.assertIn('indexes rebuilt', logs.output[-1])
+        self.assertEqual(self.indexes(), indexes)
+        self.assertEqual(scenarios_set.scenario_set.count(), 100)
+        self.assertEqual(scenarios_set.scenario_set.filter(dists__contains=[1.5]).count(),
+                         sum(1.5 in scenario.dists for scenario in scenarios_set.scenario_set.all()))
+
+    def test_small_set_keeps_indexes(self):
+        with self.assertLogs('diagnosis.models', 'INFO') as logs:
+            self.scenarios_set(100, 'small')
+        self.assertNotIn('indexes rebuilt', logs.output[-1])
@@ -0,0 +1,161 @@
+"""
+Per-request performance instrumentation.
+Code marks stages with span(), ServerTimingMiddleware collects them together with SQL query counts,
+reports them in Server-Timing header and logs one line per request.
+Enabled by adding 'diagnosis.timing.ServerTimingMiddleware' to the top of MIDDLEWARE.
+
+Setting TIMING_PROFILE_DIR turns on the sampling profiler: stacks of the request thread are sampled
+every TIMING_PROFILE_INTERVAL_MS and requests slower than TIMING_PROFILE_SLOW_MS are dumped there
+in collapsed stack format, readable by flamegraph.pl and speedscope.
+"""
+import contextvars
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('TIMING_PROFILE_DIR')
+PROFILE_SLOW_MS = float(os.getenv('TIMING_PROFILE_SLOW_MS', 1000))
+PROFILE_INTERVAL_MS = float(os.getenv('TIMING_PROFILE_INTERVAL_MS', 5))
+
+# name -> [seconds, calls] of the current request, None outside of requests
+_spans = contextvars.ContextVar('timing_spans', default=None)
+
+
+@contextmanager
+def span(name):
+    """
+    Measures a stage of the current request. Works as context manager and as decorator,
+    repeated stages add up, nested stages are reported separately
+    @param name: stage name, a token of Server-Timing header
+    """
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = spans.setdefault(name, [0.0, 0])
+        entry[0] += time.perf_counter() - started
+        entry[1] += 1
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting queries and their time
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples call stacks of another thread
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def server_timing(spans, total, queries):
+    """
+    Formats Server-Timing header value
+    """
+    entries = [f'total;dur={total * 1000:.1f}',
+               f'sql;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"']
+    entries += [f'{name};dur={seconds * 1000:.1f}' for name, (seconds, _) in spans.items()]
+    return ', '.join(entries)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        spans = OrderedDict()
+        token = _spans.set(spans)
+        queries = QueryCounter()
+        sampler = None
+        if PROFILE_DIR:
+            sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            sampler.start()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            _spans.reset(token)
+            if sampler is not None:
+                sampler.stop()
+
+        response['Server-Timing'] = server_timing(spans, total, queries)
+        logger.info("%s %s %s total=%.1fms sql=%.1fms queries=%d %s", request.method, request.path,
+                    response.status_code, total * 1000, queries.seconds * 1000, queries.count,
+                    ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, (seconds, _) in spans.items()),
+                    extra={'timing': {'method': request.method,
+                                      'path': request.path,
+                                      'status': response.status_code,
+                                      'total_ms': total * 1000,
+                                      'sql_ms': queries.seconds * 1000,
+                                      'queries': queries.count,
+                                      'spans': {name: {'ms': seconds * 1000, 'calls': calls}
+                                                for name, (seconds, calls) in spans.items()}}})
+        if sampler is not None and total * 1000 >= PROFILE_SLOW_MS:
+            self.dump_profile(sampler, request, total)
+        return response
+
+    @staticmethod
+    def dump_profile(sampler, request, total):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(PROFILE_DIR, f'{stamp}-{request.method}-{slugify(request.path)[:80]}'
+                                         f'-{total * 1000:.0f}ms.folded')
+        sampler.dump(path)
+        logger.warning("Slow request %s %s took %.0f ms, profile saved to %s", request.method, request.path,
+                       total * 1000, path)
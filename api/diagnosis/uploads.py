@@ -0,0 +1,62 @@
+"""
+Content hashing of uploaded stats files. SHA-256 is computed while the upload streams to disk,
+so finding an identical recording costs one query and no extra read of the file.
+"""
+import hashlib
+import os
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+# What to do with an upload identical to an existing recording
+REJECT = 'reject'
+# Respond with the existing recording, nothing is stored or ingested
+LINK = 'link'
+# Create a new recording marked as duplicate_of the existing one
+FORCE = 'force'
+DUPLICATE_UPLOAD_POLICY = os.getenv('DUPLICATE_UPLOAD_POLICY', LINK)
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hashes uploaded files and passes data on to the next handlers unchanged
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self._hash = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self._hash.hexdigest()
+        return None
+
+
+def hash_uploads(request):
+    """
+    Installs HashingUploadHandler for request. Has to be called before request.POST or request.FILES is read,
+    views with CSRF protection therefore go csrf_exempt outside and csrf_protect inside
+    @return: handler, its digests are filled once request.FILES is read
+    @rtype: HashingUploadHandler
+    """
+    handler = HashingUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return handler
+
+
+def file_sha256(file):
+    """
+    Hashes file object by chunks, for uploads that went around HashingUploadHandler
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -1,13 +1,31 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.main_view, name='main'),
     path('upload/', views.upload_file, name='upload'),
+    path('upload/<int:pk>/', views.upload_progress, name='upload_progress'),
     path('upload/meta/', views.upload_metafile, name='upload_meta'),
+    path('trend/', views.trend_view, name='trend'),
+    path('trend/data', views.trend_data, name='trend_data'),
     path('<slug:slug>', views.details, name='details'),
     path('<slug:slug>/plot/<graph_type>', views.testing_result_plot, name='testing_result_plot'),
     path('<slug:slug>/plot', views.testing_result_plot, name='testing_result_plot'),
     path('compare/', views.create_comparation, name='compare'),
+    path('compare/many/', views.compare_many_view, name='compare_many'),
+    path('compare/many/data', views.compare_many_data, name='compare_many_data'),
+    path('batch/<uuid:batch>/', views.batch_progress, name='batch_progress'),
+    path('cache/', views.cache_stats, name='cache_stats'),
+    path('api/v1/recordings/', api.upload_recording, name='api_upload'),
+    path('api/v1/recordings/<int:pk>/progress', api.recording_progress, name='api_progress'),
+    path('api/v1/batches/<uuid:batch>', api.batch_progress, name='api_batch_progress'),
+    path('api/v1/recordings/<slug:slug>/chart', api.recording_chart, name='api_chart'),
+    path('api/v1/recordings/<slug:slug>/pivot', api.recording_pivot, name='api_pivot'),
+    path('api/v1/recordings/<slug:slug>/compare', api.recording_compare, name='api_compare'),
+    path('api/v1/recordings/<slug:slug>/exec_time', api.recording_exec_time, name='api_exec_time'),
+    path('api/v1/recordings/<slug:slug>/slowdowns', api.recording_slowdowns, name='api_slowdowns'),
+    path('api/v1/recordings/<slug:slug>/scenarios/<str:name>', api.recording_scenario, name='api_scenario'),
+    path('api/v1/recordings/<slug:slug>/transitions', api.recording_transitions, name='api_transitions'),
+    path('api/v1/recordings/<slug:slug>/regressions', api.recording_regressions, name='api_regressions'),
 ]
@@ -1,23 +1,63 @@
 import datetime
-import io
-import json
+from urllib.parse import urlencode
 
-from django.http import HttpResponseRedirect, FileResponse
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
-from matplotlib import pyplot as plt
-
-from .forms import UploadFileForm, UploadMetaFileForm, ComparationForm
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import etag
+
+from . import analytics, file_cache, plot_cache, uploads
+from .timing import span
+from .forms import UploadFileForm, UploadMetaFileForm, ComparationForm, RecordingFilterForm, MultiComparationForm
 from .models import TestingRecording, ScenariosSet
 
+# Recordings per main page
+PAGE_SIZE = 50
+# Recordings per group in trend by default
+TREND_LAST = 100
+
 
 def main_view(request):
     """
-    Plots graphs from info aus DB
+    Lists processed recordings, newest first, PAGE_SIZE per page.
+    Pages are keyset-paginated on pk, so deep pages cost the same as the first one
     @param request:
     @return:
     """
-    recordings = TestingRecording.objects.filter(processed=True).order_by('-pk')
+    form = RecordingFilterForm(request.GET)
+    recordings = (TestingRecording.objects.filter(processed=True)
+                  .only('pk', 'date', 'title', 'commit_sha1', 'slug', 'n_targets'))
+    if form.is_valid():
+        filters = form.cleaned_data
+        if filters['n_targets']:
+            recordings = recordings.filter(n_targets=filters['n_targets'])
+        if filters['build_from'] is not None:
+            recordings = recordings.filter(build_number_int__gte=filters['build_from'])
+        if filters['build_to'] is not None:
+            recordings = recordings.filter(build_number_int__lte=filters['build_to'])
+        if filters['date_from']:
+            recordings = recordings.filter(date__gte=_start_of_day(filters['date_from']))
+        if filters['date_to']:
+            recordings = recordings.filter(date__lt=_start_of_day(filters['date_to'] + datetime.timedelta(days=1)))
+        if filters['before']:
+            recordings = recordings.filter(pk__lt=filters['before'])
+    recordings = list(recordings.order_by('-pk')[:PAGE_SIZE + 1])
+
+    next_page = None
+    if len(recordings) > PAGE_SIZE:
+        recordings = recordings[:PAGE_SIZE]
+        query = request.GET.copy()
+        query['before'] = recordings[-1].pk
+        next_page = '?' + query.urlencode()
+    first_page = None
+    if request.GET.get('before'):
+        query = request.GET.copy()
+        del query['before']
+        first_page = '?' + query.urlencode()
+
     s_rec = []
     for rec in recordings:
         title = rec.title
@@ -28,21 +68,21 @@ def main_view(request):
                       "title": title,
                       "slug": rec.slug,
                       })
-    return render(request, 'main.html', context={'data': s_rec})
+    with span('template'):
+        return render(request, 'main.html', context={'data': s_rec, 'form': form,
+                                                      'next_page': next_page, 'first_page': first_page})
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
 
 
 def details(request, slug):
     obj = get_object_or_404(TestingRecording, slug=slug)
 
-    df = obj.to_dataframe().reset_index()
-    chart_data = [list(map(str, df.columns.tolist()))] + df.values.tolist()
-    scenarios_pivot_table = obj.pivot_scenario_types()
-    if scenarios_pivot_table is not None:
-        scenarios_pivot_table = scenarios_pivot_table.to_html()
-    else:
-        scenarios_pivot_table = "Report file is missing"
-
-    rec = {"chart_data": json.dumps(list(chart_data), ensure_ascii=False),
+    rec = {"chart_url": reverse('api_chart', kwargs={'slug': obj.slug}),
+           "pivot_url": reverse('api_pivot', kwargs={'slug': obj.slug}),
+           "exec_time_url": reverse('api_exec_time', kwargs={'slug': obj.slug}),
            "date": str(obj.date),
            "n_targ": obj.n_targets,
            "title": obj.title,
@@ -50,38 +90,60 @@ def details(request, slug):
            "statistics_file": obj.file,
            "img": reverse('testing_result_plot', kwargs={'slug': obj.slug}),
            "img_min": reverse('testing_result_plot', kwargs={'slug': obj.slug, 'graph_type': 'minister'}),
-           "scenarios_pivot_table": scenarios_pivot_table,
            "sha1": obj.commit_sha1}
-    return render(request, 'details.html', context=rec)
+    with span('template'):
+        return render(request, 'details.html', context=rec)
 
 
+def _plot_etag(request, slug, graph_type='normal'):
+    obj = TestingRecording.objects.filter(slug=slug).only('pk', 'version').first()
+    if obj is None:
+        return None
+    return plot_cache.plot_etag(obj, graph_type, request.GET.get('size'))
+
+
+@etag(_plot_etag)
 def testing_result_plot(request, slug, graph_type='normal'):
     obj = get_object_or_404(TestingRecording, slug=slug)
-    fig: plt.Figure = obj.gen_plot(graph_type)
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png')
-    buf.seek(0)
-    response = FileResponse(buf, content_type="image/png", filename=f'{obj.slug}_{type}.png')
+    size = request.GET.get('size')
+    response = HttpResponse(plot_cache.get_plot(obj, graph_type, size), content_type="image/png")
+    response['Content-Disposition'] = f'inline; filename="{obj.slug}_{graph_type}.png"'
+    # Clients revalidate every time, unchanged plots cost a 304
+    patch_cache_control(response, public=True, no_cache=True)
     return response
 
 
+@csrf_exempt
 def upload_file(request):
+    hashing = uploads.hash_uploads(request)
+    return _upload_file(request, hashing)
+
+
+@csrf_protect
+def _upload_file(request, hashing):
     if request.method == 'POST':
-        form = UploadFileForm(request.POST, request.FILES)
+        form = UploadFileForm(request.POST, request.FILES, content_sha256=hashing.digests.get('file'))
         if form.is_valid():
-            obj = TestingRecording()
-            obj.date = datetime.datetime.now()
-            obj.file = form.cleaned_data['file']
-            obj.title = form.cleaned_data['title']
-            obj.commit_sha1 = form.cleaned_data['commit_sha1']
-            obj.build_number = form.cleaned_data['build_number']
-            obj.save()
-            return HttpResponseRedirect(reverse('main'))
+            obj, _ = form.save()
+            return HttpResponseRedirect(reverse('upload_progress', kwargs={'pk': obj.pk}))
     else:
         form = UploadFileForm()
     return render(request, 'upload.html', {'form': form})
 
 
+def upload_progress(request, pk):
+    obj = get_object_or_404(TestingRecording, pk=pk)
+    return render(request, 'upload_progress.html', {'title': "Обработка результатов",
+                                                    'file': obj.file.name,
+                                                    'progress_url': reverse('api_progress', kwargs={'pk': pk})})
+
+
+def batch_progress(request, batch):
+    return render(request, 'batch_progress.html', {'title': "Пересчёт статистики",
+                                                   'progress_url': reverse('api_batch_progress',
+                                                                           kwargs={'batch': batch})})
+
+
 def upload_metafile(request):
     if request.method == 'POST':
         form = UploadMetaFileForm(request.POST, request.FILES)
@@ -101,15 +163,81 @@ def create_comparation(request, obj_slug=None, prev_slug=None):
     if form.is_valid():
         obj: TestingRecording = form.cleaned_data['obj']
         prev: TestingRecording = form.cleaned_data['prev']
-        cmp_result = obj.compare(prev).reset_index()
-        chart_data = [list(map(str, cmp_result.columns.tolist()))] + cmp_result.values.tolist()
+        query = '?' + urlencode({'prev': prev.slug})
         rec = {
-            "chart_data": json.dumps(list(chart_data), ensure_ascii=False),
+            "chart_url": reverse('api_compare', kwargs={'slug': obj.slug}) + query,
+            "transitions_url": reverse('api_transitions', kwargs={'slug': obj.slug}) + query,
+            "regressions_url": reverse('api_regressions', kwargs={'slug': obj.slug}) + query,
+            "slowdowns_url": reverse('api_slowdowns', kwargs={'slug': obj.slug}) + query,
             "title": "Сравнение результатов",
             "form": ComparationForm(initial={'prev': prev, 'obj': obj})
             # "form": ComparationForm()
         }
-        return render(request, 'details_compare.html', context=rec)
+        with span('template'):
+            return render(request, 'details_compare.html', context=rec)
     else:
         form = ComparationForm()
         return render(request, 'details_compare.html', {'form': form, "title": "Сравнение результатов", })
+
+
+def compare_many_view(request):
+    form = MultiComparationForm(request.GET)
+    context = {'title': "Сравнение нескольких результатов"}
+    if form.is_valid():
+        context['data_url'] = reverse('compare_many_data') + '?' + request.GET.urlencode()
+    else:
+        form = MultiComparationForm()
+    context['form'] = form
+    return render(request, 'compare_many.html', context)
+
+
+def compare_many_data(request):
+    """
+    Code percentages per distance of base and other recordings, and their differences from base.
+    GET parameters: base - slug, others - slugs (repeated)
+    """
+    form = MultiComparationForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    recordings = [form.cleaned_data['base']] + [r for r in form.cleaned_data['others']
+                                               if r.pk != form.cleaned_data['base'].pk]
+    result = analytics.comparison(recordings)
+    return JsonResponse({
+        'recordings': [{'slug': r.slug, 'title': r.title, 'build_number': r.build_number, 'sha1': r.commit_sha1}
+                       for r in recordings],
+        'dists': result['dists'].tolist(),
+        'codes': result['codes'].tolist(),
+        'percent': analytics.nan_to_none(result['percent']),
+        'difference': analytics.nan_to_none(result['difference']),
+        'success': analytics.nan_to_none(analytics.success_share(result['percent'], result['codes'])),
+        'success_codes': analytics.SUCCESS_CODES,
+    })
+
+
+def trend_view(request):
+    return render(request, 'trend.html', {'title': "Динамика результатов",
+                                          'data_url': reverse('trend_data') + '?' + request.GET.urlencode()})
+
+
+def trend_data(request):
+    """
+    Code shares of recordings over time, see analytics.trend
+    GET parameters: n_targets, last (default TREND_LAST)
+    """
+    n_targets = request.GET.get('n_targets')
+    last = request.GET.get('last', TREND_LAST)
+    try:
+        n_targets = int(n_targets) if n_targets else None
+        last = int(last) if last else None
+    except ValueError:
+        return JsonResponse({'error': 'n_targets and last must be integers'}, status=400)
+    return JsonResponse({'codes': analytics.code_labels(),
+                         'success_codes': analytics.SUCCESS_CODES,
+                         'groups': analytics.trend(n_targets=n_targets, last=last)})
+
+
+def cache_stats(request):
+    """
+    Parsed stats file cache counters of the process that serves request
+    """
+    return JsonResponse(file_cache.stats())